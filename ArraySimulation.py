@@ -0,0 +1,408 @@
+from __future__ import annotations
+import random
+import numpy
+from Simulation import World, World_Settings, Building, Building_Types, Compartments
+from Vector2D import Vector2D
+
+#read only stand-in for Simulation.Person backed by the arrays of an Array_World
+#lets the camera (and anything else written against Person) keep working with the array engine
+class Person_View:
+    __slots__ = ("world", "id")
+    world:Array_World
+    id:int
+
+    def __init__(self, world:Array_World, id:int) -> None:
+        self.world = world
+        self.id = id
+
+    @property
+    def infected(self) -> bool:
+        return bool(self.world.infected[self.id])
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.world.alive[self.id])
+
+    @property
+    def being_treated(self) -> bool:
+        return bool(self.world.being_treated[self.id])
+
+    @property
+    def immunity(self) -> float:
+        return float(self.world.immunity[self.id])
+
+    @property
+    def infection_progress(self) -> int:
+        return int(self.world.infection_progress[self.id])
+
+    @property
+    def home(self) -> Building:
+        return self.world.building_list[self.world.home[self.id]]
+
+    @property
+    def work(self) -> Building:
+        return self.world.building_list[self.world.work[self.id]]
+
+    @property
+    def current_building(self) -> Building:
+        return self.world.building_list[self.world.current_building[self.id]]
+
+    #None if the world doesnt keep positions, like Person
+    @property
+    def position(self) -> Vector2D | None:
+        if self.world.position is None:
+            return None
+        return Vector2D(*self.world.position[self.id].tolist())
+
+    @property
+    def target_position(self) -> Vector2D | None:
+        if self.world.target_position is None:
+            return None
+        return Vector2D(*self.world.target_position[self.id].tolist())
+
+#list-like collection of Person_View, views are created on access so millions of people dont need millions of objects
+class People_Views:
+    world:Array_World
+
+    def __init__(self, world:Array_World) -> None:
+        self.world = world
+
+    def __len__(self) -> int:
+        return len(self.world.alive)
+
+    def __getitem__(self, index:int) -> Person_View:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("person index out of range")
+        return Person_View(self.world, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Person_View(self.world, i)
+
+#same simulation as World but with the state of every person stored in numpy arrays (struct of arrays)
+#each tick is a handful of vectorized passes instead of a python loop over every person
+#randomness is drawn from a numpy generator seeded from the random module, so random.seed() still makes runs reproducible
+class Array_World(World):
+    people: People_Views
+    rng: numpy.random.Generator
+
+    #buildings indexed by building id, building.people is not maintained by this engine (see occupancy)
+    building_list: list[Building]
+    #ids of the buildings of each type
+    building_ids: dict[Building_Types, numpy.ndarray]
+    building_capacity: numpy.ndarray
+    building_position: numpy.ndarray
+    building_dimensions: numpy.ndarray
+    #number of living people in each building
+    occupancy: numpy.ndarray
+
+    #person state, indexed by person id
+    infected: numpy.ndarray
+    alive: numpy.ndarray
+    being_treated: numpy.ndarray
+    immunity: numpy.ndarray
+    infection_progress: numpy.ndarray
+    home: numpy.ndarray
+    work: numpy.ndarray
+    current_building: numpy.ndarray
+
+    #for rendering, shape (population, 2), None if the world doesnt keep positions (see World_Settings.track_positions)
+    position: numpy.ndarray = None
+    target_position: numpy.ndarray = None
+
+    #(order, starts, rank) grouping of living people by building, rebuilt lazily after anyone moves or dies
+    occupant_groups: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray] | None = None
+
+    def __init__(self, target_population:int, target_hospital_capacity:int, settings:World_Settings) -> None:
+        self.rng = numpy.random.default_rng(random.getrandbits(64))
+        World.__init__(self, target_population, target_hospital_capacity, settings)
+
+    #builds the building arrays from the building objects, building ids are positions in get_all_buildings()
+    def index_buildings(self) -> None:
+        self.building_list = self.get_all_buildings()
+        building_count = len(self.building_list)
+        building_types = numpy.array([i.type.value for i in self.building_list], dtype=numpy.int64)
+
+        self.building_ids = {}
+        for type in Building_Types:
+            self.building_ids[type] = numpy.flatnonzero(building_types == type.value)
+        self.building_capacity = numpy.array([i.capacity for i in self.building_list], dtype=numpy.int64)
+        self.building_position = numpy.array([i.position.tuple() for i in self.building_list], dtype=numpy.int64).reshape(building_count, 2)
+        self.building_dimensions = numpy.array([i.dimensions.tuple() for i in self.building_list], dtype=numpy.int64).reshape(building_count, 2)
+
+    def add_people(self, target_population:int) -> None:
+        self.index_buildings()
+        building_count = len(self.building_list)
+        building_id = {id(building): index for index, building in enumerate(self.building_list)}
+
+        self.home = numpy.empty(target_population, dtype=numpy.int64)
+        self.work = numpy.empty(target_population, dtype=numpy.int64)
+        for i in range(target_population):
+            house, work = self.assign_home_and_work()
+            self.home[i] = building_id[id(house)]
+            self.work[i] = building_id[id(work)]
+
+        self.infected = numpy.zeros(target_population, dtype=bool)
+        self.alive = numpy.ones(target_population, dtype=bool)
+        self.being_treated = numpy.zeros(target_population, dtype=bool)
+        self.immunity = numpy.zeros(target_population, dtype=numpy.float64)
+        self.infection_progress = numpy.zeros(target_population, dtype=numpy.int64)
+        self.current_building = self.home.copy()
+        self.occupancy = numpy.bincount(self.current_building, minlength=building_count)
+
+        if self.settings.track_positions:
+            self.position = self.get_random_positions_in_buildings(self.current_building)
+            self.target_position = self.position.copy()
+
+        #add infected people
+        #so initial population start out infectious instead of in the incubation phase
+        initial_infected = min(self.settings.initial_infected_population, target_population)
+        self.infected[:initial_infected] = True
+        self.infection_progress[:initial_infected] = self.settings.infection_lengths[0]
+
+        self.people = People_Views(self)
+
+    #vectorized Building.get_random_position_in_building for an array of building ids
+    def get_random_positions_in_buildings(self, buildings:numpy.ndarray) -> numpy.ndarray:
+        low = self.building_position[buildings]
+        return self.rng.integers(low, low + self.building_dimensions[buildings], endpoint=True).astype(numpy.float64)
+
+    #returns living people grouped by building as (order, starts, rank)
+    #order[starts[b]:starts[b+1]] are the people in building b and rank[p] is the position of person p in that slice
+    def get_occupant_groups(self) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        if self.occupant_groups is None:
+            living = numpy.flatnonzero(self.alive)
+            order = living[numpy.argsort(self.current_building[living], kind="stable")]
+            starts = numpy.zeros(len(self.building_list) + 1, dtype=numpy.int64)
+            numpy.cumsum(self.occupancy, out=starts[1:])
+            rank = numpy.zeros(len(self.alive), dtype=numpy.int64)
+            rank[order] = numpy.arange(len(order)) - starts[self.current_building[order]]
+            self.occupant_groups = (order, starts, rank)
+        return self.occupant_groups
+
+    #counts every compartment from scratch
+    def recount_compartments(self) -> None:
+        healthy = self.alive & ~self.infected
+        self.compartment_counts = [0] * len(Compartments)
+        self.compartment_counts[Compartments.SUSCEPTIBLE.value] = int(numpy.count_nonzero(healthy & (self.immunity < 0.5)))
+        self.compartment_counts[Compartments.INFECTED.value] = int(numpy.count_nonzero(self.alive & self.infected & ~self.being_treated))
+        self.compartment_counts[Compartments.HOSPITALIZED.value] = int(numpy.count_nonzero(self.alive & self.being_treated))
+        self.compartment_counts[Compartments.IMMUNE.value] = int(numpy.count_nonzero(healthy & (self.immunity > 0.5)))
+        self.compartment_counts[Compartments.DEAD.value] = int(numpy.count_nonzero(~self.alive))
+
+    #adds healthy people with the given immunities to their compartment counts (or removes them if sign is -1)
+    def count_by_immunity(self, immunity:numpy.ndarray, sign:int) -> None:
+        self.compartment_counts[Compartments.SUSCEPTIBLE.value] += sign * int(numpy.count_nonzero(immunity < 0.5))
+        self.compartment_counts[Compartments.IMMUNE.value] += sign * int(numpy.count_nonzero(immunity > 0.5))
+
+    #vectorized Person.move
+    def move(self, people:numpy.ndarray, targets:numpy.ndarray) -> None:
+        moving = self.current_building[people] != targets
+        people = people[moving]
+        targets = targets[moving]
+        if len(people) == 0:
+            return
+
+        building_count = len(self.building_list)
+        self.occupancy -= numpy.bincount(self.current_building[people], minlength=building_count)
+        self.occupancy += numpy.bincount(targets, minlength=building_count)
+        self.current_building[people] = targets
+        if self.target_position is not None:
+            self.target_position[people] = self.get_random_positions_in_buildings(targets)
+        self.occupant_groups = None
+
+    #vectorized Person.die
+    def die(self, people:numpy.ndarray) -> None:
+        if len(people) == 0:
+            return
+
+        self.compartment_counts[Compartments.INFECTED.value] -= int(numpy.count_nonzero(~self.being_treated[people]))
+        self.compartment_counts[Compartments.HOSPITALIZED.value] -= int(numpy.count_nonzero(self.being_treated[people]))
+        self.compartment_counts[Compartments.DEAD.value] += len(people)
+        self.alive[people] = False
+        self.occupancy -= numpy.bincount(self.current_building[people], minlength=len(self.building_list))
+        self.occupant_groups = None
+
+    #closest living person less than radius away from a position, or None
+    #positions change every tick for everyone so this is a vectorized scan instead of a grid
+    def get_person_at(self, position:Vector2D, radius:float) -> Person_View | None:
+        distances = ((self.position - (position.x, position.y))**2).sum(axis=1)
+        distances[~self.alive] = numpy.inf
+        nearest = int(numpy.argmin(distances))
+        if distances[nearest] >= radius**2:
+            return None
+        return Person_View(self, nearest)
+
+    #living people inside a rectangle
+    def get_people_in_rect(self, position:Vector2D, dimensions:Vector2D) -> list[Person_View]:
+        xs = self.position[:, 0]
+        ys = self.position[:, 1]
+        inside = self.alive & (xs >= position.x) & (xs <= position.x + dimensions.x) & (ys >= position.y) & (ys <= position.y + dimensions.y)
+        return [Person_View(self, i) for i in numpy.flatnonzero(inside).tolist()]
+
+    #moves each person to a random building of the given type that isnt full
+    #works in rounds, everyone left picks a random non-full building and buildings accept people until they fill up
+    #which matches everyone picking from the non-full buildings one after another
+    #returns a mask of the people that found a building
+    def move_to_free_buildings(self, people:numpy.ndarray, type:Building_Types) -> numpy.ndarray:
+        buildings = self.building_ids[type]
+        free = self.building_capacity[buildings] - self.occupancy[buildings]
+        placed = numpy.zeros(len(people), dtype=bool)
+        remaining = self.rng.permutation(len(people))
+
+        while len(remaining) > 0:
+            open_buildings = numpy.flatnonzero(free > 0)
+            if len(open_buildings) == 0:
+                break
+
+            choices = open_buildings[self.rng.integers(0, len(open_buildings), len(remaining))]
+            order = numpy.argsort(choices, kind="stable")
+            sorted_choices = choices[order]
+            rank = numpy.arange(len(order)) - numpy.searchsorted(sorted_choices, sorted_choices)
+            accepted = rank < free[sorted_choices]
+
+            accepted_people = remaining[order[accepted]]
+            accepted_buildings = sorted_choices[accepted]
+            free -= numpy.bincount(accepted_buildings, minlength=len(free))
+            self.move(people[accepted_people], buildings[accepted_buildings])
+            placed[accepted_people] = True
+            remaining = remaining[order[~accepted]]
+
+        return placed
+
+    #spreaders that interact this tick, each with interaction_chance
+    #transmission_mode "batch" draws how many interact at once and then picks which, instead of a random number for every spreader
+    def get_interacting_spreaders(self, infectious:numpy.ndarray) -> numpy.ndarray:
+        spreaders = numpy.flatnonzero(infectious)
+        if self.settings.transmission_mode == "batch":
+            interactions = self.rng.binomial(len(spreaders), self.settings.interaction_chance)
+            return numpy.sort(spreaders[self.rng.choice(len(spreaders), interactions, replace=False)])
+        return spreaders[self.rng.random(len(spreaders)) < self.settings.interaction_chance]
+
+    #people met by interacting spreaders (with repeats), a random other occupant of the building of each spreader
+    #returns (spreaders that met someone, the person each of them met)
+    def get_contacts(self, spreaders:numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        if len(spreaders) == 0:
+            return spreaders, spreaders
+
+        order, starts, rank = self.get_occupant_groups()
+        buildings = self.current_building[spreaders]
+        occupants = starts[buildings + 1] - starts[buildings]
+        crowded = occupants > 1
+        spreaders = spreaders[crowded]
+        buildings = buildings[crowded]
+        occupants = occupants[crowded]
+
+        #pick a random occupant other than the spreader by skipping over the spreaders own slot
+        picks = self.rng.integers(0, occupants - 1)
+        picks += picks >= rank[spreaders]
+        return spreaders, order[starts[buildings] + picks]
+
+    #progresses the simulation by 1 step
+    #same rules as World.tick, applied to everyone at once
+    def tick(self) -> None:
+        if self.paused:
+            return
+
+        settings = self.settings
+        rng = self.rng
+        dormant_length, infectious_length, hospital_length = settings.infection_lengths
+        profiler = self.profiler
+        timing = profiler != None and profiler.enabled
+        if timing:
+            profiler.start()
+
+        #infect another person in the same room if not in the "dormant" stage or being treated
+        spreaders = self.get_interacting_spreaders(self.alive & ~self.being_treated & (self.infection_progress > dormant_length))
+        spreaders, others = self.get_contacts(spreaders)
+        if len(others) > 0:
+            #chance to infect a person based on their immunity and this graph
+            #https://www.desmos.com/calculator/cron2qblzw
+            infecting = rng.random(len(others)) < (1 - self.immunity[others])**2
+            others = others[infecting]
+            #the same person can be infected by several spreaders at once, only count them once
+            if self.transmissions != None:
+                #the first spreader that met each of them passed it on
+                new_contacts = ~self.infected[others]
+                newly_infected, first_contact = numpy.unique(others[new_contacts], return_index=True)
+                self.transmissions.record_many(self.get_tick(), spreaders[infecting][new_contacts][first_contact], newly_infected, self.current_building[newly_infected])
+            else:
+                newly_infected = numpy.unique(others[~self.infected[others]])
+            self.count_by_immunity(self.immunity[newly_infected], -1)
+            self.compartment_counts[Compartments.INFECTED.value] += len(newly_infected)
+            self.infected[others] = True
+            self.immunity[others] = 0
+        if timing:
+            profiler.lap("infection")
+
+        #progress infections & treatment
+        sick = numpy.flatnonzero(self.alive & self.infected & ~self.being_treated)
+
+        treated = numpy.flatnonzero(self.being_treated)
+        self.infection_progress[treated] -= rng.integers(0, 2, len(treated))
+        recovered = treated[self.infection_progress[treated] == 0]
+        self.infected[recovered] = False
+        self.immunity[recovered] = 1
+        self.being_treated[recovered] = False
+        self.compartment_counts[Compartments.HOSPITALIZED.value] -= len(recovered)
+        self.compartment_counts[Compartments.IMMUNE.value] += len(recovered)
+
+        self.infection_progress[sick] += rng.integers(0, 2, len(sick))
+        #die if person has gone through all stages of the infection
+        self.die(sick[self.infection_progress[sick] > dormant_length + infectious_length + hospital_length])
+        if timing:
+            profiler.lap("treatment")
+
+        #chance to go to hospital if person is in the "hospital" stage and there are hospitals available
+        waiting = numpy.flatnonzero(self.alive & ~self.being_treated & (self.infection_progress > dormant_length + infectious_length))
+        waiting = waiting[rng.random(len(waiting)) < settings.hospital_chance]
+        if len(waiting) > 0:
+            admitted = waiting[self.move_to_free_buildings(waiting, Building_Types.HOSPITAL)]
+            self.being_treated[admitted] = True
+            self.compartment_counts[Compartments.INFECTED.value] -= len(admitted)
+            self.compartment_counts[Compartments.HOSPITALIZED.value] += len(admitted)
+        if timing:
+            profiler.lap("hospital")
+
+        #move to new location on the first tick of each phase of the day if person is not in hospital
+        if self.time in (0, settings.day_phase_lengths[0], settings.day_phase_lengths[0] + settings.day_phase_lengths[1]):
+            movers = numpy.flatnonzero(self.alive & ~self.being_treated)
+            if self.time == 0:
+                self.move(movers, self.work[movers])
+            elif self.time == settings.day_phase_lengths[0]:
+                #chance to move to a random misc building during misc phase if there a building available
+                #otherwise go home
+                going_out = rng.random(len(movers)) < settings.misc_chance
+                going_home = movers[~going_out]
+                going_out = movers[going_out]
+                going_home = numpy.concatenate((going_home, going_out[~self.move_to_free_buildings(going_out, Building_Types.MISC)]))
+                self.move(going_home, self.home[going_home])
+            else:
+                self.move(movers, self.home[movers])
+        if timing:
+            profiler.lap("moves")
+
+        #immunity decay
+        #healthy people change compartment when their immunity passes through 0.5
+        rate = settings.immunity_decay_rate
+        crossing = numpy.flatnonzero((self.immunity >= 0.5) & (self.immunity <= 0.5 / rate))
+        crossing = crossing[self.alive[crossing] & ~self.infected[crossing]]
+        self.count_by_immunity(self.immunity[crossing], -1)
+        self.immunity *= rate
+        self.count_by_immunity(self.immunity[crossing], 1)
+        if timing:
+            profiler.lap("immunity")
+
+        #for rendering
+        #moves people towards their target position
+        if self.position is not None:
+            self.position[self.alive] += (self.target_position[self.alive] - self.position[self.alive]) * 0.25
+        if timing:
+            profiler.lap("positions")
+
+        #update time
+        self.advance_time()
+        if timing:
+            profiler.end()
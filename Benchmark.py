@@ -0,0 +1,248 @@
+#benchmarks for world construction, ticking, compartment counting and rendering at several population sizes
+#every run is appended to a history file (one json record per line) and --compare flags metrics that got slower than the previous run
+#usage: python Benchmark.py --population 1000 10000 100000 1000000
+#       python Benchmark.py --compare
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import Simulation
+
+benchmark_names: tuple[str, ...] = ("ticks", "counting", "render")
+
+#median seconds of calling function repeats times (the median so a stray slow call doesnt look like a regression)
+def time_median(function, repeats:int) -> float:
+    times = []
+    for i in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+#builds a world and times building placement and population assignment separately
+#returns ({"placement": seconds, "assignment": seconds}, world)
+def time_construction(world_class:type, population:int, hospital_capacity:int, settings:Simulation.World_Settings) -> tuple[dict[str, float], Simulation.World]:
+    timings = {}
+
+    class Timed_World(world_class):
+        def generate_buildings(self, *args) -> None:
+            start_time = time.perf_counter()
+            world_class.generate_buildings(self, *args)
+            timings["placement"] = time.perf_counter() - start_time
+
+        def add_people(self, *args) -> None:
+            start_time = time.perf_counter()
+            world_class.add_people(self, *args)
+            timings["assignment"] = time.perf_counter() - start_time
+
+    world = Timed_World(population, hospital_capacity, settings)
+    return timings, world
+
+#median seconds per tick during each phase of the day as {"work": ..., "misc": ..., "home": ...}
+#the first tick of each phase (when everyone moves) is not part of these and is timed on its own as "phase_change"
+def time_ticks(world:Simulation.World, ticks:int) -> dict[str, float]:
+    world.paused = False
+    timings = {}
+    phase_change_time = 0.
+    phase_start = 0
+    for name, length in zip(("work", "misc", "home"), world.settings.day_phase_lengths):
+        world.time = phase_start
+        start_time = time.perf_counter()
+        world.tick()
+        phase_change_time += time.perf_counter() - start_time
+
+        timings[name] = time_median(world.tick, max(min(ticks, length - 1), 1))
+        phase_start += length
+    timings["phase_change"] = phase_change_time / len(world.settings.day_phase_lengths)
+    return timings
+
+#makes a fraction of the living people infectious, as if the outbreak was at its peak
+def start_outbreak(world:Simulation.World, fraction:float) -> None:
+    infectious_progress = world.settings.infection_lengths[0] + 1
+    #array engine
+    if hasattr(world, "rng"):
+        living = world.alive.nonzero()[0]
+        infected = world.rng.choice(living, int(len(living) * fraction), replace=False)
+        world.infected[infected] = True
+        world.immunity[infected] = 0
+        world.infection_progress[infected] = infectious_progress
+        world.recount_compartments()
+        return
+
+    living = [i for i in world.people if i.alive]
+    for person in random.sample(living, int(len(living) * fraction)):
+        world.infect(person)
+        person.infection_progress = infectious_progress
+
+#median seconds per tick in the middle of the work phase with a fraction of people infectious
+def time_peak_ticks(world:Simulation.World, ticks:int, fraction:float) -> float:
+    start_outbreak(world, fraction)
+    world.paused = False
+    world.time = 0
+    world.tick()
+    return time_median(world.tick, ticks)
+
+#median seconds to count every compartment from scratch
+def time_counting(world:Simulation.World, repeats:int = 5) -> float:
+    return time_median(world.recount_compartments, repeats)
+
+#median seconds per Camera.render() on an offscreen window, zoomed in on people and zoomed out to the building density view
+#returns {"people": ..., "density": ...}
+def time_render(world:Simulation.World, frames:int, screen_size:tuple[int, int] = (1280, 720)) -> dict[str, float]:
+    #only imported when needed so the other benchmarks run without pygame or a display
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    import Camera
+
+    pygame.init()
+    screen = pygame.display.set_mode(screen_size)
+    settings = Camera.Camera_Settings()
+    camera = Camera.Camera(screen, world, None, settings)
+
+    timings = {}
+    for name, zoom in (("people", 1.), ("density", settings.density_view_zoom / 2)):
+        camera.zoom = zoom
+        #the first frame fills the sprite and tile caches
+        camera.render()
+        timings[name] = time_median(camera.render, frames)
+    return timings
+
+#runs the benchmarks on a world of every population, returns {population: {metric: seconds}}
+def run_benchmarks(world_class:type, populations:list[int], settings:Simulation.World_Settings, benchmarks:tuple[str, ...], ticks:int, frames:int, peak_fraction:float, seed:int) -> dict[str, dict[str, float]]:
+    results = {}
+    for population in populations:
+        random.seed(seed)
+        timings, world = time_construction(world_class, population, max(population // 100, 1), settings)
+        metrics = {f"construction_{name}": seconds for name, seconds in timings.items()}
+
+        if "counting" in benchmarks:
+            metrics["count_compartments"] = time_counting(world)
+        if "render" in benchmarks:
+            metrics.update({f"render_{name}": seconds for name, seconds in time_render(world, frames).items()})
+        #ticks last since they change the world
+        if "ticks" in benchmarks:
+            metrics.update({f"tick_{name}": seconds for name, seconds in time_ticks(world, ticks).items()})
+            metrics["tick_peak"] = time_peak_ticks(world, ticks, peak_fraction)
+
+        results[str(population)] = metrics
+        print(f"population {population}: " + ", ".join(f"{name} {seconds * 1000:.2f}ms" for name, seconds in metrics.items()), file=sys.stderr)
+    return results
+
+#short hash of the checked out commit, or None outside of a git repository
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_history(path:str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip() != ""]
+
+def append_history(path:str, record:dict) -> None:
+    with open(path, "a") as file:
+        file.write(json.dumps(record) + "\n")
+
+#compares the metrics two records share
+#returns rows of (population, metric, old seconds, new seconds, new / old, regressed)
+#a metric regressed if it got more than threshold (as a fraction) and min_difference seconds slower
+def compare_records(old:dict, new:dict, threshold:float, min_difference:float) -> list[tuple[str, str, float, float, float, bool]]:
+    rows = []
+    for population, metrics in new["results"].items():
+        old_metrics = old["results"].get(population, {})
+        for metric, seconds in metrics.items():
+            if metric not in old_metrics:
+                continue
+            old_seconds = old_metrics[metric]
+            ratio = seconds / old_seconds if old_seconds > 0 else float("inf")
+            rows.append((population, metric, old_seconds, seconds, ratio, ratio > 1 + threshold and seconds - old_seconds > min_difference))
+    return rows
+
+#compares the latest record with the one before it that used the same engine, layout and positions setting
+#returns False if anything regressed
+def compare_history(history:list[dict], threshold:float, min_difference:float) -> bool:
+    if len(history) == 0:
+        print("no benchmark history to compare", file=sys.stderr)
+        return True
+    new = history[-1]
+    #records from before positions could be turned off always had them
+    matching = [i for i in history[:-1] if (i["engine"], i["layout"], i.get("positions", True)) == (new["engine"], new["layout"], new.get("positions", True))]
+    if len(matching) == 0:
+        print(f"no earlier run of the {new['engine']} engine with the {new['layout']} layout{'' if new.get('positions', True) else ' without positions'} to compare against", file=sys.stderr)
+        return True
+    old = matching[-1]
+
+    print(f"{old['commit']} ({old['time']}) -> {new['commit']} ({new['time']}), {new['engine']} engine")
+    print(f"{'population':>12} {'metric':<26} {'old (ms)':>12} {'new (ms)':>12} {'change':>9}")
+    rows = compare_records(old, new, threshold, min_difference)
+    for population, metric, old_seconds, new_seconds, ratio, regressed in rows:
+        print(f"{population:>12} {metric:<26} {old_seconds * 1000:>12.3f} {new_seconds * 1000:>12.3f} {ratio - 1:>+9.1%}{'  REGRESSION' if regressed else ''}")
+
+    regressions = sum(i[5] for i in rows)
+    if regressions > 0:
+        print(f"{regressions} metric(s) more than {threshold:.0%} slower", file=sys.stderr)
+    return regressions == 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark world construction, ticks, compartment counting and rendering")
+    parser.add_argument("--population", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--engine", choices=("object", "array"), default="object")
+    parser.add_argument("--layout", choices=("random", "packed"), default="packed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-positions", action="store_true", help="run with World_Settings.track_positions off (the camera places the people it draws)")
+    parser.add_argument("--benchmarks", nargs="*", choices=benchmark_names, default=list(benchmark_names), help="benchmarks to run besides construction")
+    parser.add_argument("--ticks", type=int, default=10, help="ticks timed in each phase and at the outbreak peak")
+    parser.add_argument("--frames", type=int, default=10, help="frames timed at each zoom")
+    parser.add_argument("--peak-fraction", type=float, default=.3, help="fraction of people that are infectious at the outbreak peak")
+    parser.add_argument("--history", default="benchmark_history.jsonl", help="file the results are appended to")
+    parser.add_argument("--no-record", action="store_true", help="dont append the results to the history")
+    parser.add_argument("--compare", action="store_true", help="compare the latest run in the history with the previous one instead of running (or after running with --run)")
+    parser.add_argument("--run", action="store_true", help="run the benchmarks even with --compare")
+    parser.add_argument("--threshold", type=float, default=.1, help="fraction a metric can get slower before it counts as a regression")
+    parser.add_argument("--min-difference", type=float, default=1e-4, help="seconds a metric has to get slower before it counts as a regression")
+    arguments = parser.parse_args()
+
+    if not arguments.compare or arguments.run:
+        if arguments.engine == "array":
+            import ArraySimulation
+            world_class = ArraySimulation.Array_World
+        else:
+            world_class = Simulation.World
+
+        settings = Simulation.World_Settings()
+        settings.building_layout = arguments.layout
+        settings.track_positions = not arguments.no_positions
+
+        results = run_benchmarks(world_class, arguments.population, settings, tuple(arguments.benchmarks), arguments.ticks, arguments.frames, arguments.peak_fraction, arguments.seed)
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "engine": arguments.engine,
+            "layout": arguments.layout,
+            "positions": not arguments.no_positions,
+            "seed": arguments.seed,
+            "results": results,
+        }
+
+        print(f"{'population':>12} {'metric':<26} {'ms':>12}")
+        for population, metrics in results.items():
+            for metric, seconds in metrics.items():
+                print(f"{population:>12} {metric:<26} {seconds * 1000:>12.3f}")
+        if not arguments.no_record:
+            append_history(arguments.history, record)
+
+    if arguments.compare:
+        if not compare_history(read_history(arguments.history), arguments.threshold, arguments.min_difference):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
-import sys, pygame
+import sys, math, random, pygame
 import pygame.locals
+import numpy
 import Simulation
+import ArraySimulation
 import Graphing
+import Scheduler
+import Profiler
 from Vector2D import Vector2D
 
 class Camera_Settings:
@@ -23,11 +27,43 @@ class Camera_Settings:
     #radius of a person
     person_radius:float = 20
 
+    #colors of people are rounded to this many steps of their gradient so the same few circle sprites can be reused
+    color_steps: int = 32
+    #below this zoom people are too small to see, so buildings are shaded by how full and how infected they are instead
+    density_view_zoom: float = .25
+
+    #buildings are rendered once into square tiles of this many pixels and only blitted after that
+    building_tile_size: int = 256
+    #number of zoom levels whose tiles are kept
+    cached_zoom_levels: int = 4
+
     #speeds of the camera during movement
     speed: float = 25
     zoom_speed: float = .1
 
     font_size: int = 32
+    #font size of the profiler overlay
+    profiler_font_size: int = 20
+
+    #slowest and fastest fixed simulation speeds, past the fastest the simulation ticks as fast as it can
+    min_simulation_speed: float = .5
+    max_simulation_speed: float = 32
+
+#where the camera draws a person when the world doesnt keep positions (World_Settings.track_positions is off)
+#eased towards a random spot in the building the person is in, the same way the world eases positions every tick
+class Eased_Position:
+    __slots__ = ("position", "target_position", "building", "tick")
+    position:Vector2D
+    target_position:Vector2D
+    building:Simulation.Building
+    #tick of the world the position was last eased to
+    tick:int
+
+    def __init__(self, position:Vector2D, building:Simulation.Building, tick:int) -> None:
+        self.position = position
+        self.target_position = position.copy()
+        self.building = building
+        self.tick = tick
 
 class Camera:
     settings:Camera_Settings
@@ -48,6 +84,25 @@ class Camera:
 
     controls_image: pygame.Surface
 
+    #times the stages of each frame, toggled together with the profiler of the world with f3
+    profiler: Profiler.Stage_Profiler
+    profiler_font: pygame.font.Font
+
+    #pre-rendered person circles of every color step, keyed by (radius, border thickness) in pixels
+    person_sprites: dict[tuple[int, int], list[pygame.Surface]]
+    #(tick, occupants, infected people) of each building for the density view of the array engine, recounted once per tick
+    building_counts: tuple[int, numpy.ndarray, numpy.ndarray] = None
+    #index of each building object in the arrays of the array engine
+    building_indices: dict[Simulation.Building, int] = None
+    #pre-rendered tiles of the building layer keyed by zoom, then by tile coordinates (None for tiles without buildings)
+    #tiles are anchored to the world so moving the camera never invalidates them, only changing the zoom does
+    building_tiles: dict[float, dict[tuple[int, int], pygame.Surface | None]]
+
+    #positions of the people drawn last frame keyed by person (person id for the array engine), only used when the world keeps no positions
+    eased_positions: dict[Simulation.Person | int, Eased_Position]
+    #random spots in buildings are drawn from this so drawing never changes the random numbers of the simulation
+    rng: random.Random
+
     def color_lerp(color_a:tuple[int,int,int], color_b:tuple[int,int,int], t:float) -> tuple[int, int, int]:
         r1, g1, b1 = color_a
         r2, g2, b2 = color_b
@@ -66,15 +121,24 @@ class Camera:
         self.position = Vector2D.zero()
         self.screen_size = Vector2D(*screen.get_size())
         self.font = pygame.font.Font(size=settings.font_size)
+        self.profiler = Profiler.Stage_Profiler()
+        self.profiler_font = pygame.font.Font(size=settings.profiler_font_size)
         self.controls_image = pygame.image.load("controls.png")
+        self.person_sprites = {}
+        self.building_tiles = {}
+        self.eased_positions = {}
+        self.rng = random.Random()
     
     def update(self) -> None:
         #stop following dead people
         if self.follow_target != None and not self.follow_target.alive:
             self.follow_target = None
 
+        self.profiler.start()
         self.handle_inputs()
+        self.profiler.lap("inputs")
         self.render()
+        self.profiler.end()
 
     def handle_inputs(self) -> None:
         #keyboard inputs
@@ -115,11 +179,12 @@ class Camera:
                     self.follow_target = None
                 else:
                     mouse_position = self.inverse_project(Vector2D(*pygame.mouse.get_pos()))
-                    for person in self.world.people:
-                        if (person.position - mouse_position).length() < self.settings.person_radius * self.zoom:
-                            self.follow_target = person
-                            break
+                    self.follow_target = self.get_person_at(mouse_position, self.settings.person_radius + self.settings.people_border_thickness)
             
+            #tiles are anchored to the world so a bigger window just shows more of them
+            if event.type == pygame.VIDEORESIZE:
+                self.screen_size = Vector2D(*self.screen.get_size())
+
             #right click to pause
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
                 self.world.paused = not self.world.paused
@@ -144,7 +209,10 @@ class Camera:
                     
                     #change sim speeds with [ and ]
                     case pygame.locals.K_LEFTBRACKET:
-                        self.simulation_speed /= 2
+                        if self.simulation_speed == Scheduler.max_speed:
+                            self.simulation_speed = self.settings.max_simulation_speed
+                        else:
+                            self.simulation_speed /= 2
                     
                     case pygame.locals.K_RIGHTBRACKET:
                         self.simulation_speed *= 2
@@ -161,13 +229,17 @@ class Camera:
                     #display controls
                     case pygame.locals.K_c:
                         self.show_controls = not self.show_controls
+
+                    #f3 to profile ticks and frames
+                    case pygame.locals.K_F3:
+                        self.toggle_profiling()
             
 
         #clamp sim speed:
-        if self.simulation_speed < .5:
-            self.simulation_speed = .5
-        elif self.simulation_speed > 32:
-            self.simulation_speed = 32.
+        if self.simulation_speed < self.settings.min_simulation_speed:
+            self.simulation_speed = self.settings.min_simulation_speed
+        elif self.simulation_speed > self.settings.max_simulation_speed:
+            self.simulation_speed = Scheduler.max_speed
         
         #clamp zoom
         if self.zoom < 0.1:
@@ -177,13 +249,24 @@ class Camera:
         
         #follow
         if self.follow_target != None:
-            self.position = self.follow_target.position - self.screen_size/2
+            self.position = self.get_person_position(self.follow_target) - self.screen_size/2
     
     def project(self, position:Vector2D) -> Vector2D:
         return ((position - self.position) - self.screen_size/2) * self.zoom + self.screen_size/2
     
     def inverse_project(self, position:Vector2D) -> Vector2D:
         return ((position - self.screen_size/2)) * (1/self.zoom) + self.screen_size/2 + self.position
+
+    #screen position of the world origin rounded to a pixel, so world space layers drawn relative to it dont jitter against each other
+    def get_screen_origin(self) -> tuple[int, int]:
+        origin = self.project(Vector2D.zero())
+        return round(origin.x), round(origin.y)
+
+    #world space rectangle that is on screen (grown by margin on each side) as (left, top, right, bottom)
+    def get_visible_rect(self, margin:float = 0) -> tuple[float, float, float, float]:
+        top_left = self.inverse_project(Vector2D.zero())
+        bottom_right = self.inverse_project(self.screen_size)
+        return (top_left.x - margin, top_left.y - margin, bottom_right.x + margin, bottom_right.y + margin)
     
     def draw_ui(self) -> None:
         #render day
@@ -198,6 +281,8 @@ class Camera:
         #render current speed (or pause)
         if self.world.paused:
             speed_text = self.font.render("Paused", True, (0, 0, 0), (255,255,255))
+        elif self.simulation_speed == Scheduler.max_speed:
+            speed_text = self.font.render("max speed", True, (0, 0, 0), (255,255,255))
         else:
             speed_text = self.font.render(f"{self.simulation_speed}x", True, (0, 0, 0), (255,255,255))
         speed_rect = speed_text.get_rect()
@@ -232,61 +317,296 @@ class Camera:
             immunity_text_rect = immunity_text.get_rect(center = (self.screen_size.x//2, above_position))
             self.screen.blit(immunity_text, immunity_text_rect)
         
+        if self.profiler.enabled:
+            self.draw_profiler()
+
         #render controls image
         if self.show_controls:
             controls_rect = self.controls_image.get_rect(center = (self.screen_size.x//2, self.screen_size.y//2))
             pygame.draw.rect(self.screen, (0,0,0), controls_rect.inflate(10,10))
             self.screen.blit(self.controls_image, controls_rect)
 
-    def draw_people(self) -> None:
-        for person in self.world.people:
-            if not person.alive:
-                continue 
-            screen_x, screen_y = self.screen.get_size()
-            position = self.project(person.position)
-            radius = self.settings.person_radius * self.zoom
-            border_radius = self.settings.people_border_thickness * self.zoom
-
-            #get color
+    #turns timing of the stages of ticks and frames on or off, starting over from no samples
+    def toggle_profiling(self) -> None:
+        self.profiler.enabled = not self.profiler.enabled
+        self.profiler.reset()
+        if self.world.profiler == None:
+            self.world.profiler = Profiler.Stage_Profiler()
+        self.world.profiler.enabled = self.profiler.enabled
+        self.world.profiler.reset()
+
+    #median and 95th percentile milliseconds of every stage of ticks and frames, below the day and phase
+    def draw_profiler(self) -> None:
+        lines = []
+        for name, profiler in (("tick", self.world.profiler), ("frame", self.profiler)):
+            if profiler == None or profiler.count == 0:
+                continue
+            summary = profiler.get_summary((50, 95))
+            for stage in ["total"] + profiler.stages:
+                label = name if stage == "total" else f"  {stage}"
+                lines.append(f"{label}: {summary[stage]['p50']:.2f} / {summary[stage]['p95']:.2f} ms")
+
+        y = 2 * self.settings.font_size
+        for line in ["p50 / p95"] + lines:
+            text = self.profiler_font.render(line, True, (0, 0, 0), (255,255,255))
+            self.screen.blit(text, text.get_rect(y=y))
+            y += self.settings.profiler_font_size
+
+    #color of a color step, steps [0, color_steps) go from healthy to fully sick and the rest from healthy to fully immune
+    def get_step_color(self, color_step:int) -> tuple[int, int, int]:
+        gradient, step = divmod(color_step, self.settings.color_steps)
+        return Camera.color_lerp(self.settings.people_colors[0], self.settings.people_colors[1 + gradient], step / (self.settings.color_steps - 1))
+
+    #circle sprites of every color step for the current zoom, only rendered again when the size in pixels changes
+    def get_person_sprites(self) -> tuple[list[pygame.Surface], int]:
+        radius = round(self.settings.person_radius * self.zoom)
+        border = round(self.settings.people_border_thickness * self.zoom)
+        key = (radius, border)
+        if key not in self.person_sprites:
+            #only keep a few zoom levels around
+            if len(self.person_sprites) >= 16:
+                self.person_sprites = {}
+            sprites = []
+            for color_step in range(2 * self.settings.color_steps):
+                sprite = pygame.Surface((2 * (radius + border), 2 * (radius + border)), pygame.SRCALPHA)
+                pygame.draw.circle(sprite, (0, 0, 0), (radius + border, radius + border), radius + border)
+                pygame.draw.circle(sprite, self.get_step_color(color_step), (radius + border, radius + border), radius)
+                sprites.append(sprite)
+            self.person_sprites[key] = sprites
+        return self.person_sprites[key], radius + border
+
+    #color steps of people from arrays of their infected, infection_progress and immunity
+    def get_color_steps(self, infected:numpy.ndarray, infection_progress:numpy.ndarray, immunity:numpy.ndarray) -> numpy.ndarray:
+        steps = self.settings.color_steps - 1
+        sick_steps = numpy.rint(infection_progress * (steps / sum(self.world.settings.infection_lengths)))
+        immune_steps = steps + 1 + numpy.rint(immunity * steps)
+        return numpy.where(infected, sick_steps, immune_steps).astype(numpy.int64)
+
+    #key of a person in eased_positions
+    def get_person_key(self, person:Simulation.Person | ArraySimulation.Person_View) -> Simulation.Person | int:
+        return person.id if isinstance(person, ArraySimulation.Person_View) else person
+
+    def get_random_position_in_building(self, building:Simulation.Building) -> Vector2D:
+        return Vector2D(self.rng.randint(building.position.x, building.position.x + building.dimensions.x), self.rng.randint(building.position.y, building.position.y + building.dimensions.y))
+
+    #position of a person for a world that doesnt keep positions
+    #people seen for the first time start at a random spot of their building, people that changed building get a new target
+    #and the position is eased towards the target by as many ticks as went by since it was last drawn
+    def get_eased_position(self, key:Simulation.Person | int, building:Simulation.Building, tick:int) -> Vector2D:
+        eased = self.eased_positions.get(key)
+        if eased == None:
+            eased = Eased_Position(self.get_random_position_in_building(building), building, tick)
+            self.eased_positions[key] = eased
+            return eased.position
+
+        if eased.building is not building:
+            eased.building = building
+            eased.target_position = self.get_random_position_in_building(building)
+        if tick > eased.tick:
+            eased.position.lerp_in_place(eased.target_position, 1 - .75**(tick - eased.tick))
+        eased.tick = tick
+        return eased.position
+
+    def get_person_position(self, person:Simulation.Person | ArraySimulation.Person_View) -> Vector2D:
+        if self.world.settings.track_positions:
+            return person.position
+        world = self.world
+        return self.get_eased_position(self.get_person_key(person), person.current_building, world.day * world.day_length + world.time)
+
+    #closest living person less than radius away from a position, or None
+    #without positions in the world only people drawn last frame can be picked
+    def get_person_at(self, position:Vector2D, radius:float) -> Simulation.Person | ArraySimulation.Person_View | None:
+        if self.world.settings.track_positions:
+            return self.world.get_person_at(position, radius)
+
+        nearest = None
+        nearest_distance = radius**2
+        for key, eased in self.eased_positions.items():
+            distance = (eased.position.x - position.x)**2 + (eased.position.y - position.y)**2
+            if distance < nearest_distance:
+                nearest = key
+                nearest_distance = distance
+        if isinstance(nearest, int):
+            return ArraySimulation.Person_View(self.world, nearest)
+        return nearest
+
+    #world positions and color steps of the people in the buildings that overlap a world space rectangle, for worlds without positions
+    #people drawn last frame are kept while they are still inside the rectangle (walking out of view), everyone else is forgotten
+    def get_visible_people_in_buildings(self, left:float, top:float, right:float, bottom:float) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        world = self.world
+        tick = world.day * world.day_length + world.time
+        buildings = world.building_grid.query(Vector2D(left, top), Vector2D(right - left, bottom - top))
+
+        if isinstance(world, ArraySimulation.Array_World):
+            if self.building_indices == None:
+                self.building_indices = {building: index for index, building in enumerate(world.building_list)}
+            building_ids = numpy.array([self.building_indices[i] for i in buildings], dtype=numpy.int64)
+            inside = numpy.flatnonzero(world.alive & numpy.isin(world.current_building, building_ids))
+            walking = numpy.setdiff1d(numpy.fromiter(self.eased_positions, dtype=numpy.int64, count=len(self.eased_positions)), inside)
+            people = numpy.concatenate((inside, walking[world.alive[walking]]))
+            keys = people.tolist()
+            person_buildings = [world.building_list[i] for i in world.current_building[people].tolist()]
+            color_steps = self.get_color_steps(world.infected[people], world.infection_progress[people], world.immunity[people])
+        else:
+            #only living people are inside buildings
+            keys = [person for building in buildings for person in building.people]
+            inside = set(keys)
+            keys += [person for person in self.eased_positions if person.alive and person not in inside]
+            person_buildings = [person.current_building for person in keys]
+            color_steps = self.get_color_steps(numpy.fromiter((i.infected for i in keys), dtype=bool, count=len(keys)), numpy.fromiter((i.infection_progress for i in keys), dtype=numpy.float64, count=len(keys)), numpy.fromiter((i.immunity for i in keys), dtype=numpy.float64, count=len(keys)))
+
+        positions = [self.get_eased_position(key, building, tick) for key, building in zip(keys, person_buildings)]
+        xs = numpy.fromiter((i.x for i in positions), dtype=numpy.float64, count=len(positions))
+        ys = numpy.fromiter((i.y for i in positions), dtype=numpy.float64, count=len(positions))
+        visible = numpy.arange(len(keys)) < len(inside)
+        visible |= (xs >= left) & (xs <= right) & (ys >= top) & (ys <= bottom)
+        self.eased_positions = {keys[i]: self.eased_positions[keys[i]] for i in numpy.flatnonzero(visible).tolist()}
+        return xs[visible], ys[visible], color_steps[visible]
+
+    #world positions and color steps of the living people inside a world space rectangle
+    #only people in the cells of the person grid that overlap the rectangle are looked at
+    #(the array engine checks everyone, but in a single vectorized pass)
+    def get_visible_people(self, left:float, top:float, right:float, bottom:float) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        if not self.world.settings.track_positions:
+            return self.get_visible_people_in_buildings(left, top, right, bottom)
+
+        steps = self.settings.color_steps - 1
+        infection_length = sum(self.world.settings.infection_lengths)
+
+        if isinstance(self.world, ArraySimulation.Array_World):
+            world = self.world
+            xs = world.position[:, 0]
+            ys = world.position[:, 1]
+            visible = numpy.flatnonzero(world.alive & (xs >= left) & (xs <= right) & (ys >= top) & (ys <= bottom))
+            return xs[visible], ys[visible], self.get_color_steps(world.infected[visible], world.infection_progress[visible], world.immunity[visible])
+
+        xs = []
+        ys = []
+        color_steps = []
+        for person in self.world.get_people_in_rect(Vector2D(left, top), Vector2D(right - left, bottom - top)):
+            position = person.position
+            xs.append(position.x)
+            ys.append(position.y)
+            #number from 0 to 1 representing how infected the person is, or how immune they are
             if person.infected:
-                #number from 0 to 1 representing how infected the person it
-                infection_progress = person.infection_progress / sum(self.world.settings.infection_lengths)
-                color = Camera.color_lerp(self.settings.people_colors[0], self.settings.people_colors[1], infection_progress)
+                color_steps.append(round(person.infection_progress / infection_length * steps))
             else:
-                color = Camera.color_lerp(self.settings.people_colors[0], self.settings.people_colors[2], person.immunity)
-            if position.x + radius < 0 or position.x - radius > screen_x:
-                continue
-            if position.y + radius < 0 or position.y - radius > screen_y:
-                continue
-
-            pygame.draw.circle(self.screen, (0, 0, 0), (position.x, position.y), radius + border_radius)
-            pygame.draw.circle(self.screen, color, (position.x, position.y), radius)
-            
+                color_steps.append(steps + 1 + round(person.immunity * steps))
+        return numpy.array(xs, dtype=numpy.float64), numpy.array(ys, dtype=numpy.float64), numpy.array(color_steps, dtype=numpy.int64)
 
-    def draw_buildings(self) -> None:
-        for building in self.world.get_all_buildings():
-            screen_x, screen_y = self.screen.get_size()
-            position = self.project(building.position)
-            dimensions = building.dimensions * self.zoom
-            border_thickness = Vector2D(self.settings.building_border_thickness,self.settings.building_border_thickness) * self.zoom
-            
-            #dont render off screen buildings
-            if position.x < -dimensions.x or position.x > screen_x:
-                continue
-            if position.y < -dimensions.y or position.y > screen_y:
+    #draws every visible person as a pre-rendered sprite in a single batch
+    def draw_people(self) -> None:
+        if self.zoom < self.settings.density_view_zoom:
+            self.draw_building_density()
+            return
+
+        sprites, offset = self.get_person_sprites()
+        xs, ys, color_steps = self.get_visible_people(*self.get_visible_rect(self.settings.person_radius + self.settings.people_border_thickness))
+
+        #same as project() but for every person at once, moved to the top left corner of the sprite
+        xs = numpy.rint((xs - self.position.x - self.screen_size.x/2) * self.zoom + self.screen_size.x/2 - offset).astype(numpy.int64)
+        ys = numpy.rint((ys - self.position.y - self.screen_size.y/2) * self.zoom + self.screen_size.y/2 - offset).astype(numpy.int64)
+        self.screen.blits(zip(map(sprites.__getitem__, color_steps.tolist()), zip(xs.tolist(), ys.tolist())), doreturn = False)
+
+    #(occupants, infected people) of a building
+    def get_building_counts(self, building:Simulation.Building) -> tuple[int, int]:
+        if not isinstance(self.world, ArraySimulation.Array_World):
+            return len(building.people), building.people.infected
+
+        #the array engine doesnt keep building.people, so count everyone once per tick
+        world = self.world
+        tick = world.day * world.day_length + world.time
+        if self.building_counts == None or self.building_counts[0] != tick:
+            sick = world.alive & world.infected
+            self.building_counts = (tick, world.occupancy, numpy.bincount(world.current_building[sick], minlength=len(world.building_list)))
+        if self.building_indices == None:
+            self.building_indices = {building: index for index, building in enumerate(world.building_list)}
+        index = self.building_indices[building]
+        return int(self.building_counts[1][index]), int(self.building_counts[2][index])
+
+    #zoomed out view, each visible building gets a square whose area shows how full it is
+    #and whose color goes from healthy to sick with the share of infected people inside
+    def draw_building_density(self) -> None:
+        left, top, right, bottom = self.get_visible_rect()
+        origin_x, origin_y = self.get_screen_origin()
+        for building in self.world.building_grid.query(Vector2D(left, top), Vector2D(right - left, bottom - top)):
+            occupants, infected = self.get_building_counts(building)
+            if occupants == 0:
                 continue
 
+            fullness = min(occupants / building.capacity, 1) ** (1/2)
+            color = Camera.color_lerp(self.settings.people_colors[0], self.settings.people_colors[1], infected / occupants)
+            #rounded like the building tiles so full buildings are covered exactly
+            position = (building.position + building.dimensions * ((1 - fullness) / 2)) * self.zoom
+            dimensions = building.dimensions * (fullness * self.zoom)
+            left, top = origin_x + round(position.x), origin_y + round(position.y)
+            pygame.draw.rect(self.screen, color, pygame.Rect(left, top, max(origin_x + round(position.x + dimensions.x) - left, 1), max(origin_y + round(position.y + dimensions.y) - top, 1)))
+
+    #tiles of the building layer for the current zoom
+    def get_building_tiles(self) -> dict[tuple[int, int], pygame.Surface | None]:
+        if self.zoom not in self.building_tiles:
+            #forget the oldest zoom level (dicts keep insertion order)
+            if len(self.building_tiles) >= self.settings.cached_zoom_levels:
+                del self.building_tiles[next(iter(self.building_tiles))]
+            self.building_tiles[self.zoom] = {}
+        return self.building_tiles[self.zoom]
+
+    #renders the buildings inside a tile at the current zoom, returns None if there arent any
+    def render_building_tile(self, tile_x:int, tile_y:int) -> pygame.Surface | None:
+        tile_size = self.settings.building_tile_size
+        border = self.settings.building_border_thickness
+
+        #world space area of the tile, grown by the border so borders of buildings just outside the tile are included
+        position = Vector2D(tile_x, tile_y) * (tile_size / self.zoom) - Vector2D(border, border)
+        dimensions = Vector2D(tile_size, tile_size) * (1 / self.zoom) + Vector2D(border, border) * 2
+        buildings = self.world.building_grid.query(position, dimensions)
+        if len(buildings) == 0:
+            return None
+
+        tile = pygame.Surface((tile_size, tile_size))
+        tile.fill(self.settings.background_color)
+        for building in buildings:
+            #edges are rounded the same way in every tile so buildings split across tiles line up
+            left = building.position.x * self.zoom - tile_x * tile_size
+            top = building.position.y * self.zoom - tile_y * tile_size
+            right = left + building.dimensions.x * self.zoom
+            bottom = top + building.dimensions.y * self.zoom
+            thickness = border * self.zoom
+
             #draw border
-            pygame.draw.rect(self.screen, (0,0,0), pygame.Rect(position.x - border_thickness.x, position.y - border_thickness.y, dimensions.x + border_thickness.x*2, dimensions.y + border_thickness.y*2))
-            pygame.draw.rect(self.screen, self.settings.building_colors[building.type], pygame.Rect(position.x, position.y, dimensions.x, dimensions.y))
+            pygame.draw.rect(tile, (0,0,0), pygame.Rect(round(left - thickness), round(top - thickness), round(right + thickness) - round(left - thickness), round(bottom + thickness) - round(top - thickness)))
+            pygame.draw.rect(tile, self.settings.building_colors[building.type], pygame.Rect(round(left), round(top), round(right) - round(left), round(bottom) - round(top)))
+        return tile
+
+    #blits the visible tiles of the building layer, rendering the ones that arent cached yet
+    def draw_buildings(self) -> None:
+        tiles = self.get_building_tiles()
+        tile_size = self.settings.building_tile_size
+        screen_x, screen_y = self.screen.get_size()
+
+        origin_x, origin_y = self.get_screen_origin()
+
+        blits = []
+        for tile_x in range(math.floor(-origin_x / tile_size), math.floor((screen_x - origin_x) / tile_size) + 1):
+            for tile_y in range(math.floor(-origin_y / tile_size), math.floor((screen_y - origin_y) / tile_size) + 1):
+                if (tile_x, tile_y) not in tiles:
+                    tiles[(tile_x, tile_y)] = self.render_building_tile(tile_x, tile_y)
+                tile = tiles[(tile_x, tile_y)]
+                if tile != None:
+                    blits.append((tile, (origin_x + tile_x * tile_size, origin_y + tile_y * tile_size)))
+        self.screen.blits(blits, doreturn = False)
 
     def render(self) -> None:
         self.screen.fill(self.settings.background_color)
 
         self.draw_buildings()
+        self.profiler.lap("buildings")
         self.draw_people()
+        self.profiler.lap("people")
         
         if self.show_ui:
             self.draw_ui()
+        self.profiler.lap("ui")
 
-        pygame.display.update()
\ No newline at end of file
+        pygame.display.update()
+        self.profiler.lap("display")
\ No newline at end of file
@@ -0,0 +1,153 @@
+#runs many seeded replicates of the same world configuration across all cores and aggregates them into bands
+#usage: python Ensemble.py --population 10000 --hospital-capacity 200 --days 60 --replicates 200 --output bands.csv
+import argparse
+import csv
+import multiprocessing
+import sys
+import time
+import numpy
+import Simulation
+import Headless
+
+#collects the data points of a run in memory (same interface as the Headless writers)
+class Series_Writer:
+    data: list[tuple[int, int, int, int, int]]
+
+    def __init__(self) -> None:
+        self.data = []
+
+    def write(self, tick:int, day:int, data:tuple[int, int, int, int, int]) -> None:
+        self.data.append(data)
+
+#settings of a single run, plain values only so it pickles cheaply to worker processes
+class Replicate:
+    population: int
+    hospital_capacity: int
+    settings: dict
+    engine: str
+    seed: int
+    ticks: int
+    ticks_between_data_points: int
+
+    def __init__(self, population:int, hospital_capacity:int, settings:dict, engine:str, seed:int, ticks:int, ticks_between_data_points:int) -> None:
+        self.population = population
+        self.hospital_capacity = hospital_capacity
+        self.settings = settings
+        self.engine = engine
+        self.seed = seed
+        self.ticks = ticks
+        self.ticks_between_data_points = ticks_between_data_points
+
+#runs a replicate, only the compartment series is sent back to the parent process (never the world)
+#returns (seed, series with shape (data points, compartments), wall time in seconds)
+def run_replicate(replicate:Replicate) -> tuple[int, numpy.ndarray, float]:
+    start_time = time.perf_counter()
+    world = Headless.build_world(replicate.population, replicate.hospital_capacity, Simulation.World_Settings.from_dict(replicate.settings), replicate.engine, replicate.seed)
+    writer = Series_Writer()
+    Headless.run(world, replicate.ticks, replicate.ticks_between_data_points, writer, report_interval=0)
+    series = numpy.array(writer.data, dtype=numpy.int64).reshape(-1, len(Simulation.Compartments))
+    return replicate.seed, series, time.perf_counter() - start_time
+
+#series of every replicate of an ensemble
+class Ensemble_Result:
+    #shape (replicates, data points, compartments), ordered by seed
+    series: numpy.ndarray
+    seeds: list[int]
+    #wall time of each replicate in seconds, same order as seeds
+    wall_times: list[float]
+    ticks_between_data_points: int
+
+    def __init__(self, series:numpy.ndarray, seeds:list[int], wall_times:list[float], ticks_between_data_points:int) -> None:
+        self.series = series
+        self.seeds = seeds
+        self.wall_times = wall_times
+        self.ticks_between_data_points = ticks_between_data_points
+
+    #tick of each data point
+    def ticks(self) -> numpy.ndarray:
+        return numpy.arange(1, self.series.shape[1] + 1) * self.ticks_between_data_points
+
+    #mean over replicates, shape (data points, compartments)
+    def mean(self) -> numpy.ndarray:
+        return self.series.mean(axis=0)
+
+    #percentile over replicates, shape (data points, compartments)
+    def percentile(self, percentile:float) -> numpy.ndarray:
+        return numpy.percentile(self.series, percentile, axis=0)
+
+    #mean plus the given percentiles as {"mean": ..., "p5": ..., "p95": ...}
+    def bands(self, percentiles:tuple[float, ...] = (5, 50, 95)) -> dict[str, numpy.ndarray]:
+        output = {"mean": self.mean()}
+        for percentile in percentiles:
+            output[f"p{percentile:g}"] = self.percentile(percentile)
+        return output
+
+    #writes the bands as a csv with a column per (compartment, band)
+    def write_bands(self, path:str, percentiles:tuple[float, ...] = (5, 50, 95)) -> None:
+        bands = self.bands(percentiles)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["tick"] + [f"{name}_{band}" for name in Headless.compartment_names for band in bands])
+            for index, tick in enumerate(self.ticks()):
+                writer.writerow([int(tick)] + [round(float(bands[band][index, compartment]), 3) for compartment in range(len(Headless.compartment_names)) for band in bands])
+
+#run_replicate for imap_unordered, also returns the index of the replicate so results can be put back in order
+def run_indexed_replicate(job:tuple[int, Replicate]) -> tuple[int, tuple[int, numpy.ndarray, float]]:
+    index, replicate = job
+    return index, run_replicate(replicate)
+
+#runs replicates in a process pool (one process per core by default), printing progress to stderr
+#on_result(index, result) is called in this process as each replicate finishes
+#returns the results in the same order as replicates
+def run_replicates(replicates:list[Replicate], processes:int | None = None, progress:bool = True, on_result = None) -> list[tuple[int, numpy.ndarray, float]]:
+    results = [None] * len(replicates)
+    finished = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        for index, result in pool.imap_unordered(run_indexed_replicate, enumerate(replicates)):
+            results[index] = result
+            finished += 1
+            if on_result != None:
+                on_result(index, result)
+            if progress:
+                seed, series, wall_time = result
+                print(f"replicate {finished}/{len(replicates)} (seed {seed}) took {wall_time:.2f}s, {time.perf_counter() - start_time:.1f}s elapsed", file=sys.stderr)
+    return results
+
+#runs replicates seeded base_seed, base_seed + 1, ... of World(population, hospital_capacity, settings)
+def run_ensemble(population:int, hospital_capacity:int, settings:Simulation.World_Settings, replicates:int, ticks:int, engine:str = "array", ticks_between_data_points:int = 4, base_seed:int = 0, processes:int | None = None, progress:bool = True) -> Ensemble_Result:
+    settings_dict = settings.to_dict()
+    jobs = [Replicate(population, hospital_capacity, settings_dict, engine, base_seed + i, ticks, ticks_between_data_points) for i in range(replicates)]
+    results = run_replicates(jobs, processes, progress)
+
+    series = numpy.stack([i[1] for i in results])
+    return Ensemble_Result(series, [i[0] for i in results], [i[2] for i in results], ticks_between_data_points)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="run seeded replicates of a simulation and aggregate them")
+    parser.add_argument("--population", type=int, required=True)
+    parser.add_argument("--hospital-capacity", type=int, required=True)
+    parser.add_argument("--settings", help="json file of World_Settings fields (see World_Settings.to_dict)")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--ticks", type=int)
+    length.add_argument("--days", type=int)
+    parser.add_argument("--replicates", type=int, default=100)
+    parser.add_argument("--base-seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, help="defaults to the number of cores")
+    parser.add_argument("--engine", choices=("object", "array"), default="array")
+    parser.add_argument("--ticks-between-data-points", type=int, default=4)
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[5, 50, 95])
+    parser.add_argument("--output", required=True, help="csv file for the mean and percentile bands")
+    arguments = parser.parse_args()
+
+    settings = Headless.load_settings(arguments.settings)
+    ticks = arguments.ticks if arguments.ticks != None else arguments.days * sum(settings.day_phase_lengths)
+
+    start_time = time.perf_counter()
+    result = run_ensemble(arguments.population, arguments.hospital_capacity, settings, arguments.replicates, ticks, arguments.engine, arguments.ticks_between_data_points, arguments.base_seed, arguments.processes)
+    result.write_bands(arguments.output, tuple(arguments.percentiles))
+
+    print(f"{arguments.replicates} replicates in {time.perf_counter() - start_time:.1f}s, mean {numpy.mean(result.wall_times):.2f}s per replicate", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,131 @@
 import Simulation
+import TimeSeries
+import numpy
 import matplotlib
 #the default backend crashes for some weird reason and it was alot easier to
 #switch to this than to cater to it's needs
 matplotlib.use('Qt5Agg')
 from matplotlib import pyplot
 
+#keeps the min and max of buckets of consecutive points so long histories can be drawn with about one bucket per pixel
+#when there are more than max_buckets buckets, neighbouring buckets are merged (doubling the bucket size)
+#so appending is amortized O(1) per point and the amount of data drawn per frame stays bounded
+class Min_Max_Decimator:
+    columns: int
+    max_buckets: int
+    #points per finished bucket
+    bucket_size: int = 1
+
+    #first and last x of each finished bucket, and the min and max of each column
+    #preallocated, only the first buckets rows are used
+    start_x: numpy.ndarray
+    end_x: numpy.ndarray
+    minimum: numpy.ndarray
+    maximum: numpy.ndarray
+    buckets: int = 0
+
+    #raw points of the bucket being filled
+    pending_x: numpy.ndarray
+    pending_values: numpy.ndarray
+    pending: int = 0
+
+    def __init__(self, columns:int, max_buckets:int) -> None:
+        self.columns = columns
+        self.max_buckets = max_buckets
+        capacity = 2 * max_buckets + 2
+        self.start_x = numpy.zeros(capacity)
+        self.end_x = numpy.zeros(capacity)
+        self.minimum = numpy.zeros((capacity, columns))
+        self.maximum = numpy.zeros((capacity, columns))
+        self.pending_x = numpy.zeros(1)
+        self.pending_values = numpy.zeros((1, columns))
+
+    def append(self, xs:numpy.ndarray, values:numpy.ndarray) -> None:
+        while len(xs) > 0:
+            size = self.bucket_size
+            if self.pending == 0 and len(xs) >= size:
+                #add as many whole buckets as possible at once
+                count = min(len(xs) // size, self.max_buckets + 1 - self.buckets)
+                length = count * size
+                grouped = values[:length].reshape(count, size, self.columns)
+                self.add_buckets(xs[:length:size], xs[size - 1:length:size], grouped.min(axis=1), grouped.max(axis=1))
+                xs = xs[length:]
+                values = values[length:]
+            else:
+                take = min(size - self.pending, len(xs))
+                self.pending_x[self.pending:self.pending + take] = xs[:take]
+                self.pending_values[self.pending:self.pending + take] = values[:take]
+                self.pending += take
+                xs = xs[take:]
+                values = values[take:]
+                if self.pending == size:
+                    self.pending = 0
+                    self.add_buckets(self.pending_x[:1], self.pending_x[-1:], self.pending_values.min(axis=0, keepdims=True), self.pending_values.max(axis=0, keepdims=True))
+
+    def add_buckets(self, start_x:numpy.ndarray, end_x:numpy.ndarray, minimum:numpy.ndarray, maximum:numpy.ndarray) -> None:
+        end = self.buckets + len(start_x)
+        self.start_x[self.buckets:end] = start_x
+        self.end_x[self.buckets:end] = end_x
+        self.minimum[self.buckets:end] = minimum
+        self.maximum[self.buckets:end] = maximum
+        self.buckets = end
+        if self.buckets > self.max_buckets:
+            self.merge()
+
+    #merges neighbouring pairs of buckets, an odd bucket out is kept as it is
+    def merge(self) -> None:
+        pairs = self.buckets // 2
+        odd = self.buckets % 2
+        last = self.buckets - 1
+        self.start_x[:pairs] = self.start_x[0:2 * pairs:2]
+        self.end_x[:pairs] = self.end_x[1:2 * pairs:2]
+        self.minimum[:pairs] = numpy.minimum(self.minimum[0:2 * pairs:2], self.minimum[1:2 * pairs:2])
+        self.maximum[:pairs] = numpy.maximum(self.maximum[0:2 * pairs:2], self.maximum[1:2 * pairs:2])
+        if odd:
+            for array in (self.start_x, self.end_x, self.minimum, self.maximum):
+                array[pairs] = array[last]
+        self.buckets = pairs + odd
+
+        self.bucket_size *= 2
+        self.pending_x = numpy.zeros(self.bucket_size)
+        self.pending_values = numpy.zeros((self.bucket_size, self.columns))
+
+    #points to draw as (x, values with a column per line)
+    #each bucket is drawn as its min at its first x and its max at its last x, followed by the raw pending points
+    def get_data(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        buckets = self.buckets
+        if self.bucket_size == 1:
+            return self.start_x[:buckets].copy(), self.minimum[:buckets].copy()
+
+        xs = numpy.empty(2 * buckets + self.pending)
+        values = numpy.empty((2 * buckets + self.pending, self.columns))
+        xs[0:2 * buckets:2] = self.start_x[:buckets]
+        xs[1:2 * buckets:2] = self.end_x[:buckets]
+        values[0:2 * buckets:2] = self.minimum[:buckets]
+        values[1:2 * buckets:2] = self.maximum[:buckets]
+        xs[2 * buckets:] = self.pending_x[:self.pending]
+        values[2 * buckets:] = self.pending_values[:self.pending]
+        return xs, values
+
 class Grapher:
     world: Simulation.World
     lines: list[pyplot.Line2D]
     figure: pyplot.Figure
     axis: pyplot.Axes
-    last_data: list[tuple[int, int, int, int, int]]
-    ticks_between_data_points: int
+    store: TimeSeries.Time_Series_Store
     drawing: bool = False
-    def __init__(self, world: Simulation.World, ticks_between_data_points:int = 1):
+    #history of the lines, only new data points are read from the store and added to it
+    decimator: Min_Max_Decimator
+    #tick of the newest data point read from the store
+    last_tick: int = -1
+    #pixels of the figure without the lines, restored before drawing the lines (blitting)
+    background: object = None
+    #right edge of the x axis in days, doubled when the data reaches it so the whole figure rarely needs redrawing
+    x_limit: float = 1
+    def __init__(self, world: Simulation.World, store:TimeSeries.Time_Series_Store):
         self.world = world
-        self.ticks_between_data_points = ticks_between_data_points
-        self.last_data = []
+        self.store = store
+        self.decimator = Min_Max_Decimator(store.columns, 2000)
 
     #since the pyplot steals focus, im adding hotkeys to the pyplot itself
     def on_press(self, event) -> None:
@@ -28,10 +137,16 @@ class Grapher:
 
     def on_close(self, event) -> None:
         self.close()
+
+    #the figure was fully redrawn (shown, resized or the axes changed), save it for blitting and put the lines back on top
+    def on_draw(self, event) -> None:
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
     
     def close(self) -> None:
         self.drawing = False
         self.lines = None
+        self.background = None
         pyplot.close()
     
     #sets up and opens the graph window
@@ -41,10 +156,12 @@ class Grapher:
         
         #set up variables
         self.figure, self.axis = pyplot.subplots()
-        self.lines = [self.axis.plot([], [])[0] for i in range(5)]
+        #animated lines are left out of full redraws and drawn by blitting instead
+        self.lines = [self.axis.plot([], [], animated = True)[0] for i in range(5)]
 
         #set up axes
-        self.axis.set_ylim(0,len(self.world.people))
+        self.axis.set_ylim(0,len(self.world.people)+.5)
+        self.axis.set_xlim(0,self.x_limit)
         self.axis.legend(["Susceptible", "Infected", "Hospitalized", "Immune", "Dead"], loc="upper right")
         self.axis.set_ylabel("people")
         self.axis.set_xlabel("day")
@@ -52,44 +169,79 @@ class Grapher:
         #set up event listeners
         self.figure.canvas.mpl_connect("close_event", self.on_close)
         self.figure.canvas.mpl_connect("key_press_event", self.on_press)
+        self.figure.canvas.mpl_connect("draw_event", self.on_draw)
 
         #show graph in interactive mode
         pyplot.ion()
         pyplot.show(block = False)
         self.drawing = True
 
+        #about one bucket per horizontal pixel
+        self.decimator.max_buckets = min(self.decimator.max_buckets, max(int(self.axis.bbox.width), 100))
+
         #initialize graph with data (so that it would display something if the world was paused (since update wouldnt run if would is paused))
-        self.update_line_data(self.last_data)
-        self.axis.set_xlim(0,self.ticks_between_data_points*len(self.last_data)/self.world.day_length + .5)
+        self.read_new_data()
+        self.update_line_data()
+        self.figure.canvas.draw()
+
+    #adds the data points the store got since the last read to the decimator
+    def read_new_data(self) -> bool:
+        ticks, values = self.store.read_values("raw", self.last_tick + 1)
+        if len(ticks) == 0:
+            return False
+        
+        self.last_tick = int(ticks[-1])
+        self.decimator.append(ticks / self.world.day_length, values)
+        return True
 
-    #updates the data in the graph
-    #takes data in the form [(susceptible, infected, hospitalized, Immune, Dead)]
-    def update_line_data(self, data:list[tuple[int, int, int, int, int]]) -> None:
+    #updates the data in the graph from the decimator, returns if the x axis had to grow
+    def update_line_data(self) -> bool:
         #just in case
         if self.lines == None:
-            return
+            return False
         
+        days, values = self.decimator.get_data()
         for index, line in enumerate(self.lines):
-            line.set_data([self.ticks_between_data_points * i/self.world.day_length for i in range(len(data))], [i[index] for i in data])
+            line.set_data(days, values[:, index])
+        
+        if len(days) == 0 or days[-1] <= self.x_limit:
+            return False
+        while self.x_limit < days[-1]:
+            self.x_limit *= 2
+        self.axis.set_xlim(0,self.x_limit)
+        return True
+
+    def draw_lines(self) -> None:
+        for line in self.lines or ():
+            self.axis.draw_artist(line)
+
+    #redraws only the lines over the saved background
+    def blit(self) -> None:
+        if self.background == None:
+            return
+        self.figure.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.figure.canvas.blit(self.figure.bbox)
     
     #draws the graph and updates data
-    def update(self, data:list[tuple[int, int, int, int, int]],):
+    def update(self):
         if not self.drawing:
             return
 
-        #required for realtime graphs to work
-        #and for key press events to be received
-        #will block other parts of the program from running
-        #so while a graph is open the simulation will slow down
-        #1/100 is arbitrary
-        pyplot.pause(1/100)
+        #required for key press, resize and close events to be received
+        #unlike pyplot.pause this doesnt wait or redraw the whole figure, so it doesnt slow the simulation down
+        self.figure.canvas.flush_events()
 
         #so that graph interacation is possible when the simulation is paused
-        if self.world.paused:
+        #(also stops if the graph was closed by the events above)
+        if not self.drawing or self.world.paused:
             return
         
-        self.last_data = data
-        self.update_line_data(data)
+        if not self.read_new_data():
+            return
 
-        self.axis.set_ylim(0,len(self.world.people)+.5)
-        self.axis.set_xlim(0,self.ticks_between_data_points*len(data)/self.world.day_length + .5)
\ No newline at end of file
+        if self.update_line_data():
+            #the axes changed so the whole figure has to be redrawn, on_draw saves the new background
+            self.figure.canvas.draw()
+        else:
+            self.blit()
\ No newline at end of file
@@ -0,0 +1,182 @@
+#runs simulations without a window, for batch runs on machines without a display
+#deliberately doesnt import Camera or Graphing so pygame, Qt and matplotlib are never loaded
+#usage: python Headless.py --population 10000 --hospital-capacity 200 --days 60 --output run.csv
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+import Simulation
+import Profiler
+import Telemetry
+
+#column names of the data points, in the same order as World.compartments()
+compartment_names: tuple[str, ...] = tuple(i.name.lower() for i in Simulation.Compartments)
+
+#writes data points as rows of a csv file
+class CSV_Writer:
+    file: object
+    writer: object
+
+    def __init__(self, path:str) -> None:
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(("tick", "day") + compartment_names)
+
+    def write(self, tick:int, day:int, data:tuple[int, int, int, int, int]) -> None:
+        self.writer.writerow((tick, day) + tuple(data))
+
+    def close(self) -> None:
+        self.file.close()
+
+#writes data points column by column, each column is a file of little endian int64 values
+#plus a columns.json describing them, so a single series can be read without parsing the others
+#(e.g. numpy.fromfile("run/infected.bin", dtype="<i8"))
+class Column_Writer:
+    directory: str
+    columns: dict[str, object]
+    rows: int
+
+    def __init__(self, directory:str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.columns = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in ("tick", "day") + compartment_names}
+        self.rows = 0
+
+    def write(self, tick:int, day:int, data:tuple[int, int, int, int, int]) -> None:
+        for file, value in zip(self.columns.values(), (tick, day) + tuple(data)):
+            file.write(value.to_bytes(8, "little", signed=True))
+        self.rows += 1
+
+    def close(self) -> None:
+        for file in self.columns.values():
+            file.close()
+        with open(os.path.join(self.directory, "columns.json"), "w") as file:
+            json.dump({"dtype": "<i8", "rows": self.rows, "columns": list(self.columns)}, file)
+
+#reads World_Settings from a json file of its fields (see World_Settings.to_dict), or the defaults if path is None
+#nothing is rendered here, so people get no positions unless the file turns track_positions on
+def load_settings(path:str | None) -> Simulation.World_Settings:
+    data = {}
+    if path != None:
+        with open(path) as file:
+            data = json.load(file)
+    settings = Simulation.World_Settings.from_dict(data)
+    if "track_positions" not in data:
+        settings.track_positions = False
+    return settings
+
+#builds a world with the chosen engine ("object" is Simulation.World, "array" is ArraySimulation.Array_World)
+def build_world(population:int, hospital_capacity:int, settings:Simulation.World_Settings, engine:str = "object", seed:int | None = None) -> Simulation.World:
+    if seed is not None:
+        random.seed(seed)
+
+    if engine == "array":
+        #only imported when needed so the object engine doesnt pay for numpy
+        import ArraySimulation
+        world = ArraySimulation.Array_World(population, hospital_capacity, settings)
+    elif engine == "object":
+        world = Simulation.World(population, hospital_capacity, settings)
+    else:
+        raise ValueError(f"unknown engine: {engine}")
+
+    world.paused = False
+    return world
+
+#ticks the world as fast as possible, writing a data point every ticks_between_data_points ticks
+#telemetry (if given) is handed the state of the world after every tick and publishes it at its own rate
+#returns the number of ticks per second
+def run(world:Simulation.World, ticks:int, ticks_between_data_points:int = 4, writer:CSV_Writer | Column_Writer | None = None, report_interval:float = 5, telemetry:Telemetry.Telemetry_Server | None = None) -> float:
+    start_time = time.perf_counter()
+    last_report_time = start_time
+
+    for tick in range(1, ticks + 1):
+        world.tick()
+
+        if writer != None and tick % ticks_between_data_points == 0:
+            writer.write(tick, world.day, world.compartments())
+        if telemetry != None:
+            telemetry.publish(world)
+
+        #progress report
+        if report_interval > 0 and time.perf_counter() - last_report_time > report_interval:
+            last_report_time = time.perf_counter()
+            print(f"tick {tick}/{ticks} (day {world.day}), {tick / (last_report_time - start_time):.1f} ticks/s", file=sys.stderr)
+
+    return ticks / max(time.perf_counter() - start_time, 1e-9)
+
+def parse_arguments(argv:list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="run a pandemic simulation without rendering")
+    parser.add_argument("--population", type=int, required=True)
+    parser.add_argument("--hospital-capacity", type=int, required=True)
+    parser.add_argument("--initial-infected", type=int, help="overrides initial_infected_population from the settings")
+    parser.add_argument("--settings", help="json file of World_Settings fields (see World_Settings.to_dict)")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--ticks", type=int)
+    length.add_argument("--days", type=int)
+    parser.add_argument("--engine", choices=("object", "array"), default="object")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--ticks-between-data-points", type=int, default=4)
+    parser.add_argument("--output", help="csv file, or a directory when --format is columns")
+    parser.add_argument("--format", choices=("csv", "columns"), default="csv")
+    parser.add_argument("--profile", help="times the stages of every tick and writes a summary to this json (or .csv) file")
+    parser.add_argument("--transmissions", help="logs every infection to this file (see Transmissions.py)")
+    parser.add_argument("--telemetry-port", type=int, help="serves live telemetry over http and websockets on this port (see Telemetry.py)")
+    parser.add_argument("--telemetry-host", default="127.0.0.1", help="address to serve telemetry on, 0.0.0.0 for every interface")
+    parser.add_argument("--telemetry-rate", type=float, default=2., help="telemetry states published per second")
+    return parser.parse_args(argv)
+
+def main(argv:list[str] | None = None) -> None:
+    arguments = parse_arguments(argv)
+
+    settings = load_settings(arguments.settings)
+    if arguments.initial_infected != None:
+        settings.initial_infected_population = arguments.initial_infected
+
+    print("initializing", file=sys.stderr)
+    start_time = time.perf_counter()
+    world = build_world(arguments.population, arguments.hospital_capacity, settings, arguments.engine, arguments.seed)
+    print(f"initialized in {time.perf_counter() - start_time:.2f}s", file=sys.stderr)
+
+    ticks = arguments.ticks if arguments.ticks != None else arguments.days * world.day_length
+
+    #every tick is kept so the percentiles cover the whole run
+    if arguments.profile != None:
+        world.profiler = Profiler.Stage_Profiler(window=ticks, enabled=True)
+    if arguments.transmissions != None:
+        #only imported when needed since it needs numpy
+        import Transmissions
+        world.transmissions = Transmissions.Transmission_Recorder(world, arguments.transmissions, capacity=0)
+
+    telemetry = None
+    if arguments.telemetry_port != None:
+        telemetry = Telemetry.Telemetry_Server(world, arguments.telemetry_host, arguments.telemetry_port, arguments.telemetry_rate)
+        print(f"serving telemetry on http://{arguments.telemetry_host}:{telemetry.port}/", file=sys.stderr)
+
+    writer = None
+    if arguments.output != None:
+        writer = CSV_Writer(arguments.output) if arguments.format == "csv" else Column_Writer(arguments.output)
+
+    try:
+        ticks_per_second = run(world, ticks, arguments.ticks_between_data_points, writer, telemetry=telemetry)
+    finally:
+        if writer != None:
+            writer.close()
+        if telemetry != None:
+            #so clients see the final state
+            telemetry.publish(world, force=True)
+            telemetry.close()
+        if world.transmissions != None:
+            world.transmissions.close()
+
+    print(f"ran {ticks} ticks at {ticks_per_second:.1f} ticks/s", file=sys.stderr)
+    if arguments.profile != None:
+        world.profiler.save(arguments.profile)
+        for stage, summary in world.profiler.get_summary().items():
+            print(f"{stage:>10}: mean {summary['mean']:.3f}ms, p95 {summary['p95']:.3f}ms, {summary['share']:.1%} of tick time", file=sys.stderr)
+    print(",".join(f"{name}={value}" for name, value in zip(compartment_names, world.compartments())))
+
+if __name__ == "__main__":
+    main()
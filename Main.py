@@ -1,59 +1,109 @@
+import atexit
+import os
 import time
 import Simulation
+import ArraySimulation
 import Graphing
 import Camera
+import TimeSeries
+import Worker
+import Scheduler
+import Telemetry
 import pygame
 
-population = int(input("\npopulation: "))
-hospital_capacity = int(input("hospital capacity: "))
-ticks_between_data_points = 4
-
-#set up world
-world_settings = Simulation.World_Settings()
-world_settings.initial_infected_population = int(input("initial infected population: "))
-print("initializing, please wait")
-world = Simulation.World(population, hospital_capacity, world_settings)
-simulation_data = []
-
-#set up graph
-grapher = Graphing.Grapher(world, ticks_between_data_points)
-
-#camera
-pygame.init()
-screen_size = width, height = 1280, 720
-screen = pygame.display.set_mode(screen_size)
-camera_settings = Camera.Camera_Settings()
-camera = Camera.Camera(screen, world, grapher, camera_settings)
-
-#last update times of world, camera and graph
-last_update_times = [time.time(),]*3
-
-print("initialization complete, switch to the pygame window")
-#main update loop
-while True:
-    delta_times = [time.time() - i for i in last_update_times]
-    
-    #update world at 50 fps * sim speed
-    if delta_times[0] > (1/50) / camera.simulation_speed:
+def main() -> None:
+    population = int(input("\npopulation: "))
+    hospital_capacity = int(input("hospital capacity: "))
+    ticks_between_data_points = 4
+
+    #set up world
+    world_settings = Simulation.World_Settings()
+    world_settings.initial_infected_population = int(input("initial infected population: "))
+    #the numpy engine is much faster for large populations
+    use_array_engine = input("use numpy engine? (y/n): ").strip().lower() == "y"
+    #ticking in another process keeps the window responsive when ticks are slow (and the other way around)
+    use_worker = input("run the simulation in a separate process? (y/n): ").strip().lower() == "y"
+    #live counts over http and websockets, for watching the run from somewhere else
+    telemetry_port = input("telemetry port (leave empty for none): ").strip()
+    print("initializing, please wait")
+    if use_array_engine:
+        world = ArraySimulation.Array_World(population, hospital_capacity, world_settings)
+    else:
+        world = Simulation.World(population, hospital_capacity, world_settings)
+    if use_worker:
+        world = Worker.Remote_World(world, ticks_between_data_points)
+        atexit.register(world.close)
+
+    telemetry = None
+    if telemetry_port != "":
+        telemetry = Telemetry.Telemetry_Server(world, port=int(telemetry_port))
+        atexit.register(telemetry.close)
+        print(f"serving telemetry on http://127.0.0.1:{telemetry.port}/")
+
+    #data points are stored on disk (in runs/) with per day and per week summaries
+    simulation_data = TimeSeries.Time_Series_Store(os.path.join("runs", time.strftime("%Y-%m-%d_%H-%M-%S")), {"day": world.day_length, "week": 7 * world.day_length})
+    atexit.register(simulation_data.close)
+
+    #set up graph
+    grapher = Graphing.Grapher(world, simulation_data)
+
+    #camera
+    pygame.init()
+    screen_size = width, height = 1280, 720
+    screen = pygame.display.set_mode(screen_size)
+    camera_settings = Camera.Camera_Settings()
+    camera = Camera.Camera(screen, world, grapher, camera_settings)
+
+    #ticks are spread evenly over time at 50 ticks per second * sim speed
+    scheduler = Scheduler.Scheduler(ticks_per_second=50)
+    #camera updates at 60 fps, graph at 10 fps
+    #(camera is also responsible for user inputs)
+    frame_time = 1/60
+    graph_time = 1/10
+    next_frame_time = next_graph_time = time.perf_counter()
+
+    def tick() -> None:
         world.tick()
 
         #collect data
-        if not world.paused and world.time % ticks_between_data_points == 0:
-            susceptible = len([i for i in world.people if i.alive and not i.infected and i.immunity < 0.5])
-            infected = len([i for i in world.people if i.alive and i.infected and not i.being_treated])
-            hospitalized = len([i for i in world.people if i.alive and i.being_treated])
-            immune = len([i for i in world.people if i.alive and not i.infected and i.immunity > .5])
-            dead = len([i for i in world.people if not i.alive])
-            simulation_data.append((susceptible, infected, hospitalized, immune, dead))
-        last_update_times[0] = time.time()
-    
-    #update camera at 60 fps
-    #(camera is also responsible for user inputs)
-    if delta_times[1] > 1/60:
-        camera.update()
-        last_update_times[1] = time.time()
-
-    #update graph at 10 fps
-    if delta_times[2] > 1/10:
-        grapher.update(simulation_data)
-        last_update_times[2] = time.time()
\ No newline at end of file
+        if world.time % ticks_between_data_points == 0:
+            simulation_data.append(world.day * world.day_length + world.time, world.compartments())
+
+    print("initialization complete, switch to the pygame window")
+    #main update loop
+    while True:
+        #the worker ticks on its own, just pass the speed on and collect its data points
+        if use_worker:
+            world.set_speed(camera.simulation_speed)
+            for data_tick, data in world.update():
+                simulation_data.append(data_tick, data)
+
+        #tick until the next frame is due at the latest
+        else:
+            scheduler.run(tick, camera.simulation_speed, world.paused, next_frame_time)
+
+        #only publishes when a state is due
+        if telemetry != None:
+            telemetry.publish(world)
+
+        now = time.perf_counter()
+        if now >= next_frame_time:
+            camera.update()
+            #skip frames that were missed instead of rushing them
+            next_frame_time = max(next_frame_time + frame_time, now)
+
+        if now >= next_graph_time:
+            grapher.update()
+            next_graph_time = max(next_graph_time + graph_time, now)
+
+        #sleep until something is due instead of spinning (also while paused)
+        wake_time = min(next_frame_time, next_graph_time)
+        if not use_worker and not world.paused:
+            wake_time = min(wake_time, scheduler.get_next_tick_time(camera.simulation_speed))
+        sleep_time = wake_time - time.perf_counter()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+
+#the worker process imports this file again when it starts, so nothing may run at import time
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#runs a region of several worlds (shards), each with its own buildings and people in its own process
+#shards tick in lockstep one phase of the day at a time, and at every phase boundary people travel between them
+#travelling swaps the infection state of people in the two shards so every shard keeps its population and houses
+#the migration matrix gives the chance for a person of shard i to travel to shard j at each phase boundary
+#usage: python Metapopulation.py --population 100000 100000 50000 --hospital-capacity 2000 --days 60 --migration-rate 0.001 --output region.csv
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import numpy
+import Simulation
+import Headless
+
+#(name, dtype) of the infection state that travels with a person
+traveller_fields: tuple[tuple[str, type], ...] = (("infected", bool), ("immunity", numpy.float64), ("infection_progress", numpy.int64))
+
+#people that can travel (alive and not in hospital)
+def get_travelling_people(world:Simulation.World) -> numpy.ndarray:
+    if hasattr(world, "rng"):
+        return numpy.flatnonzero(world.alive & ~world.being_treated)
+    return numpy.fromiter((index for index, person in enumerate(world.people) if person.alive and not person.being_treated), dtype=numpy.int64)
+
+#infection state of people as a structured array (one compact record per person)
+def read_traveller_states(world:Simulation.World, people:numpy.ndarray) -> numpy.ndarray:
+    states = numpy.empty(len(people), dtype=list(traveller_fields))
+    if hasattr(world, "rng"):
+        for name, dtype in traveller_fields:
+            states[name] = getattr(world, name)[people]
+    else:
+        for state, index in zip(states, people.tolist()):
+            person = world.people[index]
+            state["infected"], state["immunity"], state["infection_progress"] = person.infected, person.immunity, person.infection_progress
+    return states
+
+#gives people the infection states of people that travelled here, keeping every count of the world up to date
+def write_traveller_states(world:Simulation.World, people:numpy.ndarray, states:numpy.ndarray) -> None:
+    if hasattr(world, "rng"):
+        for name, dtype in traveller_fields:
+            getattr(world, name)[people] = states[name]
+        world.recount_compartments()
+        return
+
+    for index, (infected, immunity, infection_progress) in zip(people.tolist(), states.tolist()):
+        person = world.people[index]
+        old_compartment = person.get_compartment()
+        if person.infected != infected:
+            person.current_building.people.infected += 1 if infected else -1
+        person.infected = infected
+        person.immunity = immunity
+        person.infection_progress = infection_progress
+        world.move_compartment(old_compartment, person.get_compartment())
+        if infected:
+            world.active_people[person] = None
+
+#entry point of a shard process
+#commands from the coordinator:
+#("travel", {shard: count}) picks that many travellers for each other shard and sends back their states
+#("run", ({shard: states}, ticks)) gives the travellers the states that came back from each shard, ticks and sends back the data points
+#("stop", None)
+def run_shard(population:int, hospital_capacity:int, settings:dict, engine:str, seed:int, ticks_between_data_points:int, connection) -> None:
+    world = Headless.build_world(population, hospital_capacity, Simulation.World_Settings.from_dict(settings), engine, seed)
+    rng = numpy.random.default_rng(seed)
+    connection.send(("ready", len(get_travelling_people(world))))
+
+    #people sent to each shard, they take on the states that shard sends back
+    travellers = {}
+    tick = 0
+    while True:
+        command, value = connection.recv()
+        if command == "stop":
+            break
+
+        elif command == "travel":
+            candidates = get_travelling_people(world)
+            picked = rng.choice(candidates, min(sum(value.values()), len(candidates)), replace=False)
+            travellers = {}
+            offset = 0
+            for shard, count in value.items():
+                travellers[shard] = picked[offset:offset + count]
+                offset += count
+            connection.send(("travellers", {shard: read_traveller_states(world, people) for shard, people in travellers.items()}))
+
+        elif command == "run":
+            arrivals, ticks = value
+            for shard, states in arrivals.items():
+                write_traveller_states(world, travellers[shard][:len(states)], states)
+            travellers = {}
+
+            #rows of (tick, compartment counts...)
+            data = []
+            for i in range(ticks):
+                world.tick()
+                tick += 1
+                if tick % ticks_between_data_points == 0:
+                    data.append((tick,) + world.compartments())
+            connection.send(("data", numpy.array(data, dtype=numpy.int64).reshape(-1, 1 + len(Simulation.Compartments)), len(get_travelling_people(world))))
+
+#chance for a person of each shard to travel to each other shard at each phase boundary, the same for every pair
+def get_uniform_migration_matrix(shards:int, migration_rate:float) -> numpy.ndarray:
+    matrix = numpy.full((shards, shards), migration_rate / max(shards - 1, 1))
+    numpy.fill_diagonal(matrix, 0)
+    return matrix
+
+#how many people each pair of shards swaps at a phase boundary
+#people travel from i to j and from j to i independently, both directions are swapped together so populations stay the same
+def get_swap_counts(migration_matrix:numpy.ndarray, travelling_counts:list[int], rng:numpy.random.Generator) -> dict[tuple[int, int], int]:
+    counts = {}
+    for i in range(len(travelling_counts)):
+        for j in range(i + 1, len(travelling_counts)):
+            count = rng.binomial(travelling_counts[i], migration_matrix[i, j]) + rng.binomial(travelling_counts[j], migration_matrix[j, i])
+            count = min(count, travelling_counts[i], travelling_counts[j])
+            if count > 0:
+                counts[(i, j)] = int(count)
+    return counts
+
+#compartment series of a region
+class Region_Result:
+    #tick of each data point
+    ticks: numpy.ndarray
+    #shape (shards, data points, compartments)
+    shard_series: numpy.ndarray
+    #number of people that travelled in total
+    travellers: int
+    wall_time: float
+
+    def __init__(self, ticks:numpy.ndarray, shard_series:numpy.ndarray, travellers:int, wall_time:float) -> None:
+        self.ticks = ticks
+        self.shard_series = shard_series
+        self.travellers = travellers
+        self.wall_time = wall_time
+
+    #series of the whole region (sum over shards), shape (data points, compartments)
+    def merged(self) -> numpy.ndarray:
+        return self.shard_series.sum(axis=0)
+
+#runs shards of the given populations in lockstep for ticks ticks
+#migration_matrix[i, j] is the chance for a travelling person of shard i to travel to shard j at each phase boundary
+#writer (see Headless) gets the merged data points
+def run_region(populations:list[int], hospital_capacities:list[int], settings:Simulation.World_Settings, ticks:int, migration_matrix:numpy.ndarray, engine:str = "array", ticks_between_data_points:int = 4, seed:int = 0, writer:Headless.CSV_Writer | Headless.Column_Writer | None = None, progress:bool = True) -> Region_Result:
+    start_time = time.perf_counter()
+    shard_count = len(populations)
+    rng = numpy.random.default_rng(seed)
+
+    #spawned so shards start from a clean interpreter whatever the parent has loaded
+    context = multiprocessing.get_context("spawn")
+    connections = []
+    processes = []
+    for index, (population, hospital_capacity) in enumerate(zip(populations, hospital_capacities)):
+        connection, shard_connection = context.Pipe()
+        process = context.Process(target=run_shard, args=(population, hospital_capacity, settings.to_dict(), engine, seed * shard_count + index, ticks_between_data_points, shard_connection), daemon=True)
+        process.start()
+        connections.append(connection)
+        processes.append(process)
+
+    try:
+        travelling_counts = [connection.recv()[1] for connection in connections]
+        if progress:
+            print(f"{shard_count} shards ready after {time.perf_counter() - start_time:.1f}s", file=sys.stderr)
+
+        phase_ends = numpy.cumsum(settings.day_phase_lengths)
+        day_length = int(phase_ends[-1])
+        shard_data = [[] for i in range(shard_count)]
+        total_travellers = 0
+        tick = 0
+        while tick < ticks:
+            #swap travellers between shards, every shard is sent all its requests before any answer is read so they pick in parallel
+            swaps = get_swap_counts(migration_matrix, travelling_counts, rng) if tick > 0 else {}
+            arrivals = [{} for i in range(shard_count)]
+            if len(swaps) > 0:
+                requests = [{} for i in range(shard_count)]
+                for (i, j), count in swaps.items():
+                    requests[i][j] = count
+                    requests[j][i] = count
+                    total_travellers += 2 * count
+                for connection, request in zip(connections, requests):
+                    connection.send(("travel", request))
+                for index, connection in enumerate(connections):
+                    for shard, states in connection.recv()[1].items():
+                        arrivals[shard][index] = states
+
+            #tick every shard up to the next phase boundary
+            time_of_day = tick % day_length
+            step = min(int(phase_ends[numpy.searchsorted(phase_ends, time_of_day, side="right")]) - time_of_day, ticks - tick)
+            for connection, shard_arrivals in zip(connections, arrivals):
+                connection.send(("run", (shard_arrivals, step)))
+            for index, connection in enumerate(connections):
+                message, data, travelling_counts[index] = connection.recv()
+                shard_data[index].append(data)
+            tick += step
+
+            #the data points of the region are the sums over shards (every shard has the same ticks)
+            if writer != None:
+                merged = sum(i[-1][:, 1:] for i in shard_data)
+                for data_tick, data in zip(shard_data[0][-1][:, 0].tolist(), merged.tolist()):
+                    writer.write(data_tick, data_tick // day_length, tuple(data))
+            if progress and tick % day_length == 0:
+                print(f"day {tick // day_length}, {tick / (time.perf_counter() - start_time):.1f} ticks/s", file=sys.stderr)
+
+        for connection in connections:
+            connection.send(("stop", None))
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+    shard_series = numpy.stack([numpy.concatenate(i) for i in shard_data])
+    return Region_Result(shard_series[0, :, 0], shard_series[:, :, 1:], total_travellers, time.perf_counter() - start_time)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="run several worlds in parallel processes with people travelling between them")
+    parser.add_argument("--population", type=int, nargs="+", required=True, help="population of each shard")
+    parser.add_argument("--hospital-capacity", type=int, nargs="+", required=True, help="hospital capacity of each shard, or one for all of them")
+    parser.add_argument("--settings", help="json file of World_Settings fields (see World_Settings.to_dict)")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--ticks", type=int)
+    length.add_argument("--days", type=int)
+    migration = parser.add_mutually_exclusive_group()
+    migration.add_argument("--migration-rate", type=float, default=.001, help="chance for a person to travel to another shard (any of them) at each phase boundary")
+    migration.add_argument("--migration-matrix", help="json file of a shards x shards matrix of chances to travel from shard i to shard j at each phase boundary")
+    parser.add_argument("--engine", choices=("object", "array"), default="array")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ticks-between-data-points", type=int, default=4)
+    parser.add_argument("--output", help="csv file of the merged data points")
+    arguments = parser.parse_args()
+
+    settings = Headless.load_settings(arguments.settings)
+    ticks = arguments.ticks if arguments.ticks != None else arguments.days * sum(settings.day_phase_lengths)
+
+    shards = len(arguments.population)
+    hospital_capacities = arguments.hospital_capacity * shards if len(arguments.hospital_capacity) == 1 else arguments.hospital_capacity
+    if len(hospital_capacities) != shards:
+        parser.error("give one hospital capacity, or one for every shard")
+    if arguments.migration_matrix != None:
+        with open(arguments.migration_matrix) as file:
+            migration_matrix = numpy.array(json.load(file), dtype=numpy.float64)
+        if migration_matrix.shape != (shards, shards):
+            parser.error(f"the migration matrix has to be {shards}x{shards}")
+    else:
+        migration_matrix = get_uniform_migration_matrix(shards, arguments.migration_rate)
+
+    writer = Headless.CSV_Writer(arguments.output) if arguments.output != None else None
+    try:
+        result = run_region(arguments.population, hospital_capacities, settings, ticks, migration_matrix, arguments.engine, arguments.ticks_between_data_points, arguments.seed, writer)
+    finally:
+        if writer != None:
+            writer.close()
+
+    print(f"ran {ticks} ticks of {sum(arguments.population)} people in {shards} shards in {result.wall_time:.1f}s ({sum(arguments.population) * ticks / result.wall_time:.0f} person ticks/s), {result.travellers} people travelled", file=sys.stderr)
+    print(",".join(f"{name}={value}" for name, value in zip(Headless.compartment_names, result.merged()[-1].tolist())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#timing of the stages of something that repeats, like a tick of the world or a frame of the camera
+#a stage is timed by lap() (time since the previous lap() or start()) or add(), end() finishes the sample of one tick or frame
+#the last window samples of every stage are kept for rolling percentiles, totals are kept over every sample
+#turned off lap() and end() return straight away, loops that run for every person check enabled once and time nothing
+import csv
+import json
+import time
+from collections import deque
+
+class Stage_Profiler:
+    enabled: bool = False
+    window: int
+
+    #stage names in the order they were first timed
+    stages: list[str]
+    #seconds spent in each stage in each of the last window samples, "total" is the sum of the stages
+    samples: dict[str, deque]
+    #seconds spent in each stage over every sample
+    totals: dict[str, float]
+    #seconds spent in each stage in the sample that is being timed
+    current: dict[str, float]
+    #number of finished samples
+    count: int = 0
+    last_time: float
+
+    def __init__(self, window:int = 300, enabled:bool = False) -> None:
+        self.window = window
+        self.enabled = enabled
+        self.stages = []
+        self.samples = {"total": deque(maxlen=window)}
+        self.totals = {"total": 0.}
+        self.current = {}
+        self.last_time = time.perf_counter()
+
+    def start(self) -> None:
+        self.last_time = time.perf_counter()
+
+    #adds the time since the previous lap (or start) to a stage
+    def lap(self, stage:str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[stage] = self.current.get(stage, 0.) + now - self.last_time
+        self.last_time = now
+
+    def add(self, stage:str, seconds:float) -> None:
+        self.current[stage] = self.current.get(stage, 0.) + seconds
+
+    #finishes the current sample, stages that werent timed in it count as 0
+    def end(self) -> None:
+        if not self.enabled:
+            return
+        for stage in self.current:
+            if stage not in self.totals:
+                self.stages.append(stage)
+                self.samples[stage] = deque(maxlen=self.window)
+                self.totals[stage] = 0.
+
+        total = 0.
+        for stage in self.stages:
+            seconds = self.current.get(stage, 0.)
+            self.samples[stage].append(seconds)
+            self.totals[stage] += seconds
+            total += seconds
+        self.samples["total"].append(total)
+        self.totals["total"] += total
+        self.current = {}
+        self.count += 1
+
+    #forgets every sample
+    def reset(self) -> None:
+        self.__init__(self.window, self.enabled)
+
+    #percentile (0 to 100) of the kept samples of a stage in seconds, interpolating between the closest samples
+    def get_percentile(self, stage:str, percentile:float) -> float:
+        values = sorted(self.samples[stage])
+        if len(values) == 0:
+            return 0.
+        position = (len(values) - 1) * percentile / 100
+        below = int(position)
+        above = min(below + 1, len(values) - 1)
+        return values[below] + (values[above] - values[below]) * (position - below)
+
+    #{stage: {"mean": ..., "p50": ..., "p95": ..., "max": ..., "share": ...}} in milliseconds over the kept samples
+    #share is the fraction of the time of every sample spent in the stage
+    def get_summary(self, percentiles:tuple[float, ...] = (50, 95, 99)) -> dict[str, dict[str, float]]:
+        summary = {}
+        for stage in self.stages + ["total"]:
+            values = self.samples[stage]
+            stage_summary = {"mean": 1000 * sum(values) / max(len(values), 1)}
+            for percentile in percentiles:
+                stage_summary[f"p{percentile:g}"] = 1000 * self.get_percentile(stage, percentile)
+            stage_summary["max"] = 1000 * max(values, default=0.)
+            stage_summary["share"] = self.totals[stage] / self.totals["total"] if self.totals["total"] > 0 else 0.
+            summary[stage] = stage_summary
+        return summary
+
+    #writes the summary as csv (if path ends with .csv) or json
+    def save(self, path:str, percentiles:tuple[float, ...] = (50, 95, 99)) -> None:
+        summary = self.get_summary(percentiles)
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                columns = list(summary["total"])
+                writer.writerow(["stage"] + [f"{i}_ms" if i != "share" else i for i in columns] + ["total_s"])
+                for stage, stage_summary in summary.items():
+                    writer.writerow([stage] + [round(stage_summary[i], 6) for i in columns] + [round(self.totals[stage], 6)])
+        else:
+            with open(path, "w") as file:
+                json.dump({"samples": self.count, "window": self.window, "total_seconds": self.totals, "stages_ms": summary}, file, indent=1)
@@ -0,0 +1,62 @@
+#fixed timestep scheduling of simulation ticks next to a display
+#
+#time that passes (scaled by the speed) is added up and paid out in whole ticks, so ticks happen at a steady rate
+#no matter how often they get the chance to run, and several ticks run at once to catch up after a slow frame
+#ticking always stops at a deadline (usually the next frame) so the display keeps its rate even when ticks are slow
+import math
+import time
+from typing import Callable
+
+#speed at which the simulation ticks as fast as it can instead of at a fixed rate
+max_speed: float = math.inf
+
+class Scheduler:
+    #ticks per second at 1x speed
+    ticks_per_second: float
+    #seconds of ticks that are kept owing when ticking is slower than the speed asks for, the rest is dropped
+    max_backlog: float
+
+    #ticks owed, whole ones are run by run()
+    accumulator: float = 0.
+    last_time: float
+
+    def __init__(self, ticks_per_second:float = 50, max_backlog:float = .1) -> None:
+        self.ticks_per_second = ticks_per_second
+        self.max_backlog = max_backlog
+        self.last_time = time.perf_counter()
+
+    #runs the ticks that are due at speed until deadline (a time.perf_counter() time) and returns how many ran
+    #a due tick always runs even if the deadline has passed, at max_speed it ticks until the deadline
+    def run(self, tick:Callable[[], None], speed:float, paused:bool, deadline:float) -> int:
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+        self.last_time = now
+
+        #nothing is owed for time spent paused
+        if paused:
+            self.accumulator = 0.
+            return 0
+
+        ticks = 0
+        if speed == max_speed:
+            self.accumulator = 0.
+            while True:
+                tick()
+                ticks += 1
+                if time.perf_counter() >= deadline:
+                    return ticks
+
+        self.accumulator = min(self.accumulator + elapsed * speed * self.ticks_per_second, max(self.max_backlog * speed * self.ticks_per_second, 1.))
+        while self.accumulator >= 1:
+            tick()
+            ticks += 1
+            self.accumulator -= 1
+            if time.perf_counter() >= deadline:
+                break
+        return ticks
+
+    #time.perf_counter() time at which the next tick is due at speed (now if it is already due)
+    def get_next_tick_time(self, speed:float) -> float:
+        if speed == max_speed or self.accumulator >= 1:
+            return self.last_time
+        return self.last_time + (1 - self.accumulator) / (speed * self.ticks_per_second)
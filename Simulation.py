@@ -1,41 +1,148 @@
 from __future__ import annotations
+import math
 import random
+import time
 from enum import Enum 
 from Vector2D import Vector2D
+import Profiler
 class Person:
     infected:bool = False
     alive:bool = True
     being_treated:bool = False
-    immunity:float = 0
+    #immunity decays every tick, so it is stored as the value it was set to and the tick it was set at (see immunity)
+    immunity_value:float = 0
+    immunity_tick:int = 0
     infection_progress:int = 0
+    world:World
+    #index of this person in world.people
+    id:int
     home:Building
     work:Building
     current_building:Building
-
-    #for rendering
-    position:Vector2D
-    target_position:Vector2D
-    def __init__(self, home:Building, work:Building) -> None:
+    #index of this person in current_building.people
+    building_slot:int
+    #cell of this person in world.person_grid
+    grid_cell:tuple[int, int]
+
+    #for rendering, None if the world doesnt keep positions (see World_Settings.track_positions)
+    position:Vector2D = None
+    target_position:Vector2D = None
+    def __init__(self, world:World, home:Building, work:Building) -> None:
+        self.world = world
         self.home = home
         self.work = work
         self.current_building = home
-        home.people.append(self)
+        home.people.add(self)
 
+        if not world.settings.track_positions:
+            return
         self.position = self.current_building.get_random_position_in_building()
         self.target_position = self.position.copy()
+        if world.person_grid != None:
+            world.person_grid.add(self)
+
+    #immunity decayed by immunity_decay_rate for every tick since it was set
+    #worked out when read so healthy people dont have to be visited every tick
+    @property
+    def immunity(self) -> float:
+        if self.immunity_value == 0:
+            return 0.
+        world = self.world
+        return self.immunity_value * world.settings.immunity_decay_rate ** (world.day * world.day_length + world.time - self.immunity_tick)
+
+    @immunity.setter
+    def immunity(self, immunity:float) -> None:
+        self.immunity_value = immunity
+        self.immunity_tick = self.world.get_tick()
+        self.world.schedule_immunity_crossing(self)
+
+    #compartment based on immunity alone, for alive people that arent infected
+    #exactly 0.5 immunity is counted as neither susceptible or immune
+    def get_immunity_compartment(immunity:float) -> Compartments | None:
+        if immunity < 0.5:
+            return Compartments.SUSCEPTIBLE
+        elif immunity > 0.5:
+            return Compartments.IMMUNE
+        return None
+
+    def get_compartment(self) -> Compartments | None:
+        if not self.alive:
+            return Compartments.DEAD
+        elif self.being_treated:
+            return Compartments.HOSPITALIZED
+        elif self.infected:
+            return Compartments.INFECTED
+        return Person.get_immunity_compartment(self.immunity)
 
     def die(self):
+        self.world.move_compartment(self.get_compartment(), Compartments.DEAD)
         self.alive = False
         self.current_building.people.remove(self)
+        self.world.update_free_building(self.current_building)
+        if self.world.person_grid != None:
+            self.world.person_grid.remove(self)
 
     def move(self, target:Building) -> None:
         if target is self.current_building:
             return
         
         self.current_building.people.remove(self)
+        self.world.update_free_building(self.current_building)
         self.current_building = target
-        target.people.append(self)
-        self.target_position = target.get_random_position_in_building()
+        target.people.add(self)
+        self.world.update_free_building(target)
+        if self.world.settings.track_positions:
+            self.target_position = target.get_random_position_in_building()
+
+#compartments people are counted in for statistics
+#in the same order as the data points collected for the graph
+class Compartments(Enum):
+    SUSCEPTIBLE = 0
+    INFECTED = 1
+    HOSPITALIZED = 2
+    IMMUNE = 3
+    DEAD = 4
+
+#people inside a building, with O(1) add, remove and random sampling
+#people are kept in a list and removed by swapping the last person into their slot
+#each person stores their slot in building_slot (a person is only ever in one building)
+#can be iterated and len()'d like a list
+class Occupants:
+    people: list[Person]
+    #number of infected people inside, kept up to date by add(), remove() and World.tick() (for the zoomed out view of the camera)
+    infected: int
+
+    def __init__(self) -> None:
+        self.people = []
+        self.infected = 0
+
+    def __len__(self) -> int:
+        return len(self.people)
+
+    def __iter__(self):
+        return iter(self.people)
+
+    def __getitem__(self, index:int) -> Person:
+        return self.people[index]
+
+    def add(self, person:Person) -> None:
+        person.building_slot = len(self.people)
+        self.people.append(person)
+        self.infected += person.infected
+
+    def remove(self, person:Person) -> None:
+        self.infected -= person.infected
+        last = self.people.pop()
+        if last is not person:
+            self.people[person.building_slot] = last
+            last.building_slot = person.building_slot
+
+    #random person other than the given person (who must be in this building)
+    def random_other(self, person:Person) -> Person:
+        index = random.randrange(len(self.people) - 1)
+        if index >= person.building_slot:
+            index += 1
+        return self.people[index]
 
 #types enum
 class Building_Types(Enum):
@@ -46,7 +153,7 @@ class Building_Types(Enum):
     
 class Building:
     assigned: int = 0
-    people: list[Person]
+    people: Occupants
     capacity: int
     type: int
 
@@ -57,7 +164,7 @@ class Building:
     def __init__(self, capacity:int, type:int, position:Vector2D, dimensions:Vector2D) -> None:
         self.capacity = capacity
         self.type = type
-        self.people = []
+        self.people = Occupants()
 
         self.position = position 
         self.dimensions = dimensions
@@ -66,6 +173,157 @@ class Building:
         return Vector2D(random.randint(self.position.x, self.position.x + self.dimensions.x), random.randint(self.position.y, self.position.y + self.dimensions.y))
     
 
+#number of successes out of trials tries that each succeed with chance
+#jumps from one success to the next with geometrically distributed gaps, so it takes O(successes) random numbers instead of O(trials)
+def random_binomial(trials:int, chance:float) -> int:
+    if chance <= 0:
+        return 0
+    if chance >= 1:
+        return trials
+    log_failure = math.log(1 - chance)
+    successes = 0
+    tries = 0
+    while True:
+        tries += int(math.log(1 - random.random()) / log_failure) + 1
+        if tries > trials:
+            return successes
+        successes += 1
+
+#set with O(1) add, remove and random choice
+#items are kept in a list and removed by swapping the last item into their slot, positions maps each item to its slot
+class Random_Set:
+    items: list
+    positions: dict[object, int]
+
+    def __init__(self, items = ()) -> None:
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item) -> bool:
+        return item in self.positions
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, item) -> None:
+        if item in self.positions:
+            return
+        self.positions[item] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item) -> None:
+        index = self.positions.pop(item)
+        last = self.items.pop()
+        if index < len(self.items):
+            self.items[index] = last
+            self.positions[last] = index
+
+    def discard(self, item) -> None:
+        if item in self.positions:
+            self.remove(item)
+
+    def choice(self):
+        return random.choice(self.items)
+
+#uniform grid of square cells over the world, each cell lists the buildings that overlap it
+#lets overlap tests only look at the buildings near a rectangle instead of every building
+class Building_Grid:
+    cell_size: int
+    cells: dict[tuple[int, int], list[Building]]
+    #every building in the grid, in insertion order
+    buildings: list[Building]
+
+    def __init__(self, cell_size:int = 512) -> None:
+        self.cell_size = cell_size
+        self.cells = {}
+        self.buildings = []
+
+    #range of cell coordinates covered by a rectangle
+    def get_cell_range(self, position:Vector2D, dimensions:Vector2D) -> tuple[range, range]:
+        x_range = range(int(position.x // self.cell_size), int((position.x + dimensions.x) // self.cell_size) + 1)
+        y_range = range(int(position.y // self.cell_size), int((position.y + dimensions.y) // self.cell_size) + 1)
+        return x_range, y_range
+
+    def add(self, building:Building) -> None:
+        x_range, y_range = self.get_cell_range(building.position, building.dimensions)
+        for x in x_range:
+            for y in y_range:
+                self.cells.setdefault((x, y), []).append(building)
+        self.buildings.append(building)
+
+    #buildings in the cells covered by a rectangle (may include buildings that dont actually overlap it)
+    def query(self, position:Vector2D, dimensions:Vector2D) -> set[Building]:
+        output = set()
+        x_range, y_range = self.get_cell_range(position, dimensions)
+        for x in x_range:
+            for y in y_range:
+                output.update(self.cells.get((x, y), ()))
+        return output
+
+    #checks if a rectangle intersects any building in the grid
+    def intersects_any(self, position:Vector2D, dimensions:Vector2D) -> bool:
+        return any(World.intersects(position, dimensions, i.position, i.dimensions) for i in self.query(position, dimensions))
+
+#uniform grid over the positions of people, for finding the people in an area (rendering and mouse picking) without checking everyone
+#people walking between buildings are moved to a new cell by World.tick() when they cross into it
+#built by World.get_person_grid() the first time something needs it, so headless runs dont pay for keeping it up to date
+class Person_Grid:
+    cell_size: int
+    cells: dict[tuple[int, int], set[Person]]
+
+    def __init__(self, cell_size:int = 512) -> None:
+        self.cell_size = cell_size
+        self.cells = {}
+
+    #cells are compared with tuples of floats in World.tick(), which are equal to these since x // cell_size is a whole number
+    def get_cell(self, position:Vector2D) -> tuple[int, int]:
+        return (int(position.x // self.cell_size), int(position.y // self.cell_size))
+
+    def add(self, person:Person, cell:tuple[int, int] | None = None) -> None:
+        person.grid_cell = self.get_cell(person.position) if cell == None else cell
+        self.cells.setdefault(person.grid_cell, set()).add(person)
+
+    def remove(self, person:Person) -> None:
+        cell = self.cells[person.grid_cell]
+        cell.discard(person)
+        if len(cell) == 0:
+            del self.cells[person.grid_cell]
+
+    #moves a person to the cell of their current position if they left their old one
+    def update(self, person:Person) -> None:
+        cell = self.get_cell(person.position)
+        if cell != person.grid_cell:
+            self.remove(person)
+            self.add(person, cell)
+
+    #people inside a rectangle
+    def query(self, position:Vector2D, dimensions:Vector2D) -> list[Person]:
+        output = []
+        left, top = position.x, position.y
+        right, bottom = position.x + dimensions.x, position.y + dimensions.y
+        for x in range(int(left // self.cell_size), int(right // self.cell_size) + 1):
+            for y in range(int(top // self.cell_size), int(bottom // self.cell_size) + 1):
+                for person in self.cells.get((x, y), ()):
+                    if left <= person.position.x <= right and top <= person.position.y <= bottom:
+                        output.append(person)
+        return output
+
+    #closest person less than radius away from a position, or None
+    def get_nearest(self, position:Vector2D, radius:float) -> Person | None:
+        nearest = None
+        nearest_distance = radius**2
+        for person in self.query(position - Vector2D(radius, radius), Vector2D(radius, radius) * 2):
+            distance = (person.position.x - position.x)**2 + (person.position.y - position.y)**2
+            if distance < nearest_distance:
+                nearest = person
+                nearest_distance = distance
+        return nearest
+
 class World_Settings:
     #min/max per building capacities
     per_building_capacities:dict[Building_Types:tuple[int,int]] = {
@@ -85,6 +343,11 @@ class World_Settings:
     #chance for an infected person to interact with someone in the same building per frame
     interaction_chance:float = 1/100
 
+    #how interactions are drawn
+    #"agent" draws a chance to interact for every infectious person
+    #"batch" draws how many infectious people interact at once and then picks which (same odds, fewer random numbers)
+    transmission_mode:str = "agent"
+
     #chance for an infected person to attempt to go to the hosiptal per frame    
     hospital_chance:float = 1/100
     
@@ -97,8 +360,16 @@ class World_Settings:
     immunity_decay_rate:float = .9995
 
     #below fields only effect rendering
+    #keeps a position for every person that is eased towards a random spot in their building every tick
+    #turned off the world stores no positions at all and the camera places the people it draws itself (faster when nothing is drawn)
+    track_positions:bool = True
+
+    #how buildings are laid out
+    #"random" scatters buildings around each other, "packed" places them in rows grouped by type (much faster for big worlds)
+    building_layout:str = "random"
+
     #minimum space between each building
-    building_margin = Vector2D(25, 25)
+    building_margin:Vector2D = Vector2D(25, 25)
 
     #min and max full sizes (actually size is scaled down by capacity) 
     building_size_ranges:dict[Building_Types:tuple[int,int]] = {
@@ -108,10 +379,61 @@ class World_Settings:
         Building_Types.MISC: (350, 400),
     }
 
+    #converts the settings into plain json friendly values (building types are stored by name)
+    def to_dict(self) -> dict:
+        output = {}
+        for name in World_Settings.__annotations__:
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                value = {type.name: list(i) for type, i in value.items()}
+            elif isinstance(value, Vector2D):
+                value = list(value.tuple())
+            elif isinstance(value, tuple):
+                value = list(value)
+            output[name] = value
+        return output
+
+    #inverse of to_dict, fields missing from data keep their default values
+    def from_dict(data:dict) -> World_Settings:
+        settings = World_Settings()
+        for name, value in data.items():
+            if name not in World_Settings.__annotations__:
+                raise KeyError(f"unknown world setting: {name}")
+            default = getattr(World_Settings, name)
+            if isinstance(default, dict):
+                value = {Building_Types[type]: tuple(i) for type, i in value.items()}
+            elif isinstance(default, Vector2D):
+                value = Vector2D(*value)
+            elif isinstance(default, tuple):
+                value = tuple(value)
+            setattr(settings, name, value)
+        return settings
+
 class World:
     buildings: dict[int, list[Building]]
+    building_grid: Building_Grid
+    #living people by position, kept up to date by Person and tick() once get_person_grid() built it
+    person_grid: Person_Grid = None
+    #houses and work places that still have spots that arent assigned to anyone
+    unassigned_buildings: dict[Building_Types, Random_Set]
+    #buildings with fewer people in them than their capacity, kept up to date by Person.move() and Person.die()
+    free_buildings: dict[Building_Types, Random_Set]
     people: list[Person]
+    #people tick() visits on ticks without a phase change (a dict used as an ordered set)
+    #infected people and, while positions are kept, people walking to their building, everyone else only does something at phase changes
+    active_people: dict[Person, None]
+    #healthy people whose immunity passes through 0.5 at a tick (so they change compartment), by tick
+    immunity_crossings: dict[int, dict[Person, None]]
+    #number of people in each compartment, indexed by Compartments value
+    #kept up to date by tick() so reading it doesnt depend on the population size
+    compartment_counts: list[int]
     paused: bool = True
+    #times the stages of tick() while enabled, None until profiling is first turned on
+    profiler: Profiler.Stage_Profiler = None
+    #records every infection while set, see Transmissions.Transmission_Recorder
+    transmissions: Transmissions.Transmission_Recorder = None
+    #stages of tick() in the order they run
+    tick_stages: tuple[str, ...] = ("infection", "treatment", "hospital", "moves", "immunity", "positions")
     
     day_length:int
     time:int = 0
@@ -122,13 +444,24 @@ class World:
         self.buildings = {}
         for type in Building_Types:
             self.buildings[type] = []
+        self.building_grid = Building_Grid()
         self.people = []
+        self.active_people = {}
+        self.immunity_crossings = {}
         self.settings = settings
 
         #so we only have to calculate this once
         self.day_length = sum(settings.day_phase_lengths)
         
         #initialize the world
+        self.generate_buildings(target_population, target_hospital_capacity)
+
+        #add people
+        self.add_people(target_population)
+        self.recount_compartments()
+
+    #adds and lays out every building
+    def generate_buildings(self, target_population:int, target_hospital_capacity:int) -> None:
         #add misc
         self.add_buildings(Building_Types.MISC, target_population)
         #add hospitals
@@ -137,22 +470,128 @@ class World:
         self.add_buildings(Building_Types.WORK, target_population)
         #add houses
         self.add_buildings(Building_Types.HOUSE, target_population)
+        if self.settings.building_layout == "packed":
+            self.pack_buildings()
+
+        self.unassigned_buildings = {}
+        for type in (Building_Types.HOUSE, Building_Types.WORK):
+            self.unassigned_buildings[type] = Random_Set(i for i in self.buildings[type] if i.capacity > i.assigned)
+
+    #picks a random house and work place with an empty spot and reserves a spot in both
+    #buildings are dropped from unassigned_buildings once full so each pick is O(1)
+    def assign_home_and_work(self) -> tuple[Building, Building]:
+        house = self.unassigned_buildings[Building_Types.HOUSE].choice()
+        work = self.unassigned_buildings[Building_Types.WORK].choice()
+
+        for building in (house, work):
+            building.assigned += 1
+            if building.assigned >= building.capacity:
+                self.unassigned_buildings[building.type].remove(building)
+
+        return house, work
 
+    #creates the population and infects the initial infected people
+    def add_people(self, target_population:int) -> None:
         for i in range(target_population):
-            #pick a random house and work place with an empty spot
-            house = random.choice([i for i in self.buildings[Building_Types.HOUSE] if i.capacity > i.assigned])
-            work = random.choice([i for i in self.buildings[Building_Types.WORK] if i.capacity > i.assigned])
-            
-            house.assigned += 1
-            work.assigned += 1
+            person = Person(self, *self.assign_home_and_work())
+            person.id = i
+            self.people.append(person)
 
-            self.people.append(Person(house, work))
+        self.free_buildings = {}
+        for type in Building_Types:
+            self.free_buildings[type] = Random_Set(i for i in self.buildings[type] if i.capacity > len(i.people))
         
         #add infected people
-        for i in range(settings.initial_infected_population):
+        for i in range(self.settings.initial_infected_population):
             self.people[i].infected = True
+            self.people[i].current_building.people.infected += 1
             #so initial population start out infectious instead of in the incubation phase
-            self.people[i].infection_progress = settings.infection_lengths[0]
+            self.people[i].infection_progress = self.settings.infection_lengths[0]
+        self.find_active_people()
+
+    #works out active_people and immunity_crossings from scratch, after people were created or loaded
+    def find_active_people(self) -> None:
+        self.active_people = {}
+        self.immunity_crossings = {}
+        for person in self.people:
+            if not person.alive:
+                continue
+            if person.infected or person.position is not person.target_position:
+                self.active_people[person] = None
+            self.schedule_immunity_crossing(person)
+
+    #remembers the first tick after a person's immunity was set that it passes through 0.5, so tick() can recount them then
+    def schedule_immunity_crossing(self, person:Person) -> None:
+        value = person.immunity_value
+        rate = self.settings.immunity_decay_rate
+        if value <= 0 or rate == 1:
+            return
+        ticks = math.log(.5 / value) / math.log(rate)
+        if ticks < 0:
+            return
+
+        #corrected with the same expression Person.immunity uses, so rounding cant put the crossing a tick off
+        compartment = Person.get_immunity_compartment(value)
+        ticks = max(math.ceil(ticks), 1)
+        while ticks > 1 and Person.get_immunity_compartment(value * rate ** (ticks - 1)) != compartment:
+            ticks -= 1
+        while Person.get_immunity_compartment(value * rate ** ticks) == compartment:
+            ticks += 1
+
+        tick = person.immunity_tick + ticks
+        if tick > self.get_tick():
+            self.immunity_crossings.setdefault(tick, {})[person] = None
+
+    #moves healthy people whose immunity passed through 0.5 on the tick that just ended to their new compartment
+    #crossings of people whose immunity was set again since find nothing to move
+    def update_immunity_crossings(self) -> None:
+        tick = self.get_tick()
+        people = self.immunity_crossings.pop(tick, None)
+        if people == None:
+            return
+        rate = self.settings.immunity_decay_rate
+        for person in people:
+            #infected people are counted by their infection
+            if not person.alive or person.infected:
+                continue
+            ticks = tick - person.immunity_tick
+            new_compartment = Person.get_immunity_compartment(person.immunity_value * rate ** ticks)
+            self.move_compartment(Person.get_immunity_compartment(person.immunity_value * rate ** (ticks - 1)), new_compartment)
+            #exactly 0.5 is counted as neither, which it leaves on the next tick
+            if new_compartment == None:
+                self.immunity_crossings.setdefault(tick + 1, {})[person] = None
+
+    #adds or removes a building from free_buildings after people enter or leave it
+    def update_free_building(self, building:Building) -> None:
+        if building.capacity > len(building.people):
+            self.free_buildings[building.type].add(building)
+        else:
+            self.free_buildings[building.type].discard(building)
+
+    #counts every compartment from scratch
+    def recount_compartments(self) -> None:
+        self.compartment_counts = [0] * len(Compartments)
+        for person in self.people:
+            compartment = person.get_compartment()
+            if compartment != None:
+                self.compartment_counts[compartment.value] += 1
+
+    #moves a person from one compartment count to another
+    def move_compartment(self, old:Compartments | None, new:Compartments | None) -> None:
+        if old is new:
+            return
+        if old != None:
+            self.compartment_counts[old.value] -= 1
+        if new != None:
+            self.compartment_counts[new.value] += 1
+
+    #returns (susceptible, infected, hospitalized, immune, dead)
+    def compartments(self) -> tuple[int, int, int, int, int]:
+        return tuple(self.compartment_counts)
+
+    #number of ticks since the world started
+    def get_tick(self) -> int:
+        return self.day * self.day_length + self.time
 
     #returns the current phase of the day
     #0 is work, 1 is misc and 2 is home
@@ -185,18 +624,18 @@ class World:
     #generates a building position that doesnt overlap
     #currently just generates random positions until it finds one
     #picks a random building to act as a starting point, moves randomly around that building until a valid spot is found
+    #candidates are only checked against nearby buildings using the building grid
     def get_new_building_position(self, dimensions:Vector2D) -> Vector2D:
         #edge case for first building
-        buildings = self.get_all_buildings()
-        if len(buildings) == 0:
+        if len(self.building_grid.buildings) == 0:
             return Vector2D.zero()
         
-        position = random.choice(buildings).position.copy()
-        margin = Vector2D(25, 25)
+        position = random.choice(self.building_grid.buildings).position.copy()
+        margin = self.settings.building_margin
 
         while True:
             position = position + Vector2D(random.randint(-dimensions.x, dimensions.x), random.randint(-dimensions.x, dimensions.x))
-            if not any(World.intersects(position - margin, dimensions + margin * 2, i.position, i.dimensions) for i in buildings):
+            if not self.building_grid.intersects_any(position - margin, dimensions + margin * 2):
                 return position
         
     #randomly generates new buildings until target capacity is added
@@ -209,20 +648,75 @@ class World:
             capacity = added_capacity if current_capacity + added_capacity <= target_capacity else max(min_capacity, target_capacity - current_capacity)
             
             #scaled by capacity/max_capacity to make larger buildings bigger
-            dimensions = Vector2D(random.randint(*World_Settings.building_size_ranges[type]), random.randint(*World_Settings.building_size_ranges[type]))*(capacity/max_capacity)
+            dimensions = Vector2D(random.randint(*self.settings.building_size_ranges[type]), random.randint(*self.settings.building_size_ranges[type]))*(capacity/max_capacity)
             #round to int since get_new_building_position() requires integer positions
             dimensions = Vector2D(round(dimensions.x), round(dimensions.y))
-            position = self.get_new_building_position(dimensions)
-            self.buildings[type].append(Building(capacity,type, position, dimensions))
+            
+            if self.settings.building_layout == "packed":
+                #positioned later by pack_buildings()
+                self.buildings[type].append(Building(capacity, type, Vector2D.zero(), dimensions))
+            else:
+                building = Building(capacity,type, self.get_new_building_position(dimensions), dimensions)
+                self.buildings[type].append(building)
+                self.building_grid.add(building)
             current_capacity += added_capacity
-    
+
+    #deterministically lays out every building in rows (shelf packing)
+    #each building type gets its own band of rows, tallest buildings first, so the layout is roughly square
+    def pack_buildings(self) -> None:
+        margin = self.settings.building_margin
+        total_area = sum((i.dimensions.x + margin.x) * (i.dimensions.y + margin.y) for i in self.get_all_buildings())
+        row_width = max(total_area ** (1/2), max(i.dimensions.x for i in self.get_all_buildings()))
+
+        x = 0
+        y = 0
+        for type in Building_Types:
+            row_height = 0
+            for building in sorted(self.buildings[type], key=lambda i: i.dimensions.y, reverse=True):
+                #start a new row if the building doesnt fit in this one
+                if x > 0 and x + building.dimensions.x > row_width:
+                    x = 0
+                    y += row_height + margin.y
+                    row_height = 0
+                
+                building.position = Vector2D(x, y)
+                self.building_grid.add(building)
+                x += building.dimensions.x + margin.x
+                row_height = max(row_height, building.dimensions.y)
+            
+            #next type starts on a new row
+            if x > 0:
+                x = 0
+                y += row_height + margin.y
+
     #progresses the simulation by 1 step
     def tick(self) -> None:
         if self.paused:
             return
         
+        person_grid = self.person_grid
+        track_positions = self.settings.track_positions
+        batch_transmission = self.settings.transmission_mode == "batch"
+        #infectious people for transmission_mode "batch"
+        spreaders = []
+
+        #everyone moves on the first tick of each phase, on other ticks only the active people have anything to do
+        phase_lengths = self.settings.day_phase_lengths
+        phase_change = self.time == 0 or self.time == phase_lengths[0] or self.time == phase_lengths[0] + phase_lengths[1]
+        active_people = self.active_people
+        #people are added back while they are updated if they are still active, and by infect()
+        next_active_people = self.active_people = {}
+
+        profiler = self.profiler
+        timing = profiler != None and profiler.enabled
+        if timing:
+            #stages are timed for every person, so they are added up in locals and handed to the profiler after the loop
+            perf_counter = time.perf_counter
+            stage_times = [0.] * len(World.tick_stages)
+            last_time = perf_counter()
+
         #update people
-        for person in self.people:
+        for person in (self.people if phase_change else active_people):
 
             if not person.alive:
                 continue
@@ -230,22 +724,27 @@ class World:
             #infect another person in the same room if not in the "dormant" stage or being treated
             #random chance to "interact" with another person in the same room
             #the other person is then infected based on a formula
-            if not person.being_treated and person.infection_progress > self.settings.infection_lengths[0] and random.random() < self.settings.interaction_chance and len(person.current_building.people) > 1:
-                other_person = random.choice([i for i in person.current_building.people if not (i is person)])
+            if not batch_transmission and not person.being_treated and person.infection_progress > self.settings.infection_lengths[0] and random.random() < self.settings.interaction_chance and len(person.current_building.people) > 1:
+                other_person = person.current_building.people.random_other(person)
 
                 #chance to infect a person based on their immunity and this graph
                 #https://www.desmos.com/calculator/cron2qblzw
                 if random.random() < (1-other_person.immunity)**2:
-                    other_person.infected = True
-                    other_person.immunity = 0
+                    self.infect(other_person, person)
+            if timing:
+                now = perf_counter()
+                stage_times[0] += now - last_time
+                last_time = now
             
             #progress infections & treatment
             if person.being_treated:
                 person.infection_progress -= random.randint(0,1)
                 if person.infection_progress == 0:
                     person.infected = False
+                    person.current_building.people.infected -= 1
                     person.immunity = 1
                     person.being_treated = False
+                    self.move_compartment(Compartments.HOSPITALIZED, Compartments.IMMUNE)
 
             elif person.infected:
                 person.infection_progress += random.randint(0,1)
@@ -254,13 +753,23 @@ class World:
                 if person.infection_progress > sum(self.settings.infection_lengths):
                     person.die()
                     continue
+            if timing:
+                now = perf_counter()
+                stage_times[1] += now - last_time
+                last_time = now
 
             #chance to go to hospital if person is in the "hospital" stage and there are hospitals available
             if not person.being_treated and person.infection_progress > sum(self.settings.infection_lengths[:2]):
-                hospitals = [i for i in self.buildings[Building_Types.HOSPITAL] if i.capacity > len(i.people)]
+                hospitals = self.free_buildings[Building_Types.HOSPITAL]
                 if len(hospitals) > 0 and random.random() < self.settings.hospital_chance:
-                    person.move(random.choice(hospitals))
+                    old_compartment = person.get_compartment()
+                    person.move(hospitals.choice())
                     person.being_treated = True 
+                    self.move_compartment(old_compartment, Compartments.HOSPITALIZED)
+            if timing:
+                now = perf_counter()
+                stage_times[2] += now - last_time
+                last_time = now
 
             #move to new location on the first tick of each phase of the day if person is not in hospital
             if not person.being_treated:
@@ -270,9 +779,9 @@ class World:
                     #chance to move to a random misc building during misc phase if there a building available
                     #otherwise go home
                     if random.random() < self.settings.misc_chance:
-                        misc_buildings = [i for i in self.buildings[Building_Types.MISC] if i.capacity > len(i.people)]
+                        misc_buildings = self.free_buildings[Building_Types.MISC]
                         if len(misc_buildings) != 0:
-                            person.move(random.choice(misc_buildings))
+                            person.move(misc_buildings.choice())
                         else:
                             person.move(person.home)
                         
@@ -280,14 +789,108 @@ class World:
                         person.move(person.home)
                 elif self.time == self.settings.day_phase_lengths[0] + self.settings.day_phase_lengths[1]:
                         person.move(person.home)
+            if timing:
+                now = perf_counter()
+                stage_times[3] += now - last_time
+                last_time = now
             
-            #immunity decay
-            person.immunity *= self.settings.immunity_decay_rate
-
             #for rendering
-            #moves the person towards their target position
-            person.position = Vector2D.lerp(person.position, person.target_position, 0.25)
+            #moves the person towards their target position, people that already arrived are skipped
+            position = person.position
+            if track_positions and position is not person.target_position:
+                target_position = person.target_position
+                #in place since the position isnt shared until it snaps to the target
+                position.lerp_in_place(target_position, 0.25)
+                #snap to the target once less than half a unit away
+                if abs(target_position.x - position.x) < .5 and abs(target_position.y - position.y) < .5:
+                    person.position = position = target_position
+                #inlined Person_Grid.update() since this runs for every walking person every tick
+                if person_grid != None and (position.x // person_grid.cell_size, position.y // person_grid.cell_size) != person.grid_cell:
+                    person_grid.update(person)
+            if timing:
+                now = perf_counter()
+                stage_times[5] += now - last_time
+                last_time = now
+
+            if person.infected or position is not person.target_position:
+                next_active_people[person] = None
+
+            #interactions are drawn once everyone has moved
+            if batch_transmission and not person.being_treated and person.infection_progress > self.settings.infection_lengths[0]:
+                spreaders.append(person)
+
+        if timing:
+            for stage, seconds in zip(World.tick_stages, stage_times):
+                profiler.add(stage, seconds)
+            profiler.start()
+
+        if batch_transmission:
+            self.spread_in_batch(spreaders)
+            if timing:
+                profiler.lap("infection")
+
         #update time
+        self.advance_time()
+
+        #immunity decays lazily (see Person.immunity), only people whose immunity passes through 0.5 are recounted
+        self.update_immunity_crossings()
+        if timing:
+            profiler.lap("immunity")
+            profiler.end()
+
+    #infects a living person (does nothing to people that are already infected except resetting their immunity)
+    #source is the person that passed it on, for the transmission log
+    def infect(self, person:Person, source:Person | None = None) -> None:
+        old_compartment = person.get_compartment()
+        if not person.infected:
+            person.current_building.people.infected += 1
+            if self.transmissions != None:
+                self.transmissions.record(self.get_tick(), source, person)
+        person.infected = True
+        person.immunity = 0
+        self.move_compartment(old_compartment, person.get_compartment())
+        self.active_people[person] = None
+
+    #interactions of transmission_mode "batch", with the same odds as the ones drawn for each person in tick()
+    #how many spreaders interact is drawn once, then that many are picked (so the number in each building is a binomial of its spreader count)
+    def spread_in_batch(self, spreaders:list[Person]) -> None:
+        for person in random.sample(spreaders, random_binomial(len(spreaders), self.settings.interaction_chance)):
+            if len(person.current_building.people) > 1:
+                other_person = person.current_building.people.random_other(person)
+
+                #chance to infect a person based on their immunity and this graph
+                #https://www.desmos.com/calculator/cron2qblzw
+                if random.random() < (1-other_person.immunity)**2:
+                    self.infect(other_person, person)
+
+    def get_person_grid(self) -> Person_Grid:
+        if self.person_grid == None:
+            self.person_grid = Person_Grid()
+            for person in self.people:
+                if person.alive:
+                    self.person_grid.add(person)
+        return self.person_grid
+
+    #living people inside a rectangle
+    def get_people_in_rect(self, position:Vector2D, dimensions:Vector2D) -> list[Person]:
+        return self.get_person_grid().query(position, dimensions)
+
+    #closest living person less than radius away from a position, or None
+    def get_person_at(self, position:Vector2D, radius:float) -> Person | None:
+        return self.get_person_grid().get_nearest(position, radius)
+
+    #saves the world to a compact binary snapshot (see Snapshot.py)
+    def save(self, path:str) -> None:
+        import Snapshot
+        Snapshot.save_world(self, path)
+
+    #loads a world saved with World.save(), also restores the state of the random module
+    def load(path:str) -> World:
+        import Snapshot
+        return Snapshot.load_world(path)
+
+    #moves the clock forward by 1 tick, rolling over into the next day
+    def advance_time(self) -> None:
         self.time += 1
         if self.time >= self.day_length:
             self.time = 0
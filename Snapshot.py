@@ -0,0 +1,286 @@
+#saving and loading running worlds (World.save(path) / World.load(path))
+#
+#file layout:
+#   magic (8 bytes) | header length (uint64 little endian) | json header | arrays
+#the header holds the scalar state (time, settings, random number generator states...) and the dtype, shape and offset of each array
+#buildings are stored as a table and people as packed arrays, people refer to buildings by their index in get_all_buildings()
+#arrays are 64 byte aligned and loaded with copy on write memory maps, so nothing is parsed on load
+#
+#usage: python Snapshot.py --check (saves a world mid run, loads it and checks that both worlds tick identically)
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import numpy
+import Simulation
+import ArraySimulation
+from Vector2D import Vector2D
+
+magic: bytes = b"PANDEMIC"
+version: int = 1
+alignment: int = 64
+
+#saves a world (either engine), including the state of the random module so loaded worlds carry on identically
+def save_world(world:Simulation.World, path:str) -> None:
+    buildings = world.get_all_buildings()
+    building_id = {id(building): index for index, building in enumerate(buildings)}
+
+    arrays = {
+        "building_type": numpy.array([i.type.value for i in buildings], dtype=numpy.int8),
+        "building_capacity": numpy.array([i.capacity for i in buildings], dtype=numpy.int32),
+        "building_assigned": numpy.array([i.assigned for i in buildings], dtype=numpy.int32),
+        "building_position": numpy.array([i.position.tuple() for i in buildings], dtype=numpy.int64).reshape(len(buildings), 2),
+        "building_dimensions": numpy.array([i.dimensions.tuple() for i in buildings], dtype=numpy.int64).reshape(len(buildings), 2),
+    }
+    header = {
+        "version": version,
+        "settings": world.settings.to_dict(),
+        "time": world.time,
+        "day": world.day,
+        "paused": world.paused,
+        "compartment_counts": list(world.compartment_counts),
+        "random_state": random.getstate(),
+    }
+
+    if isinstance(world, ArraySimulation.Array_World):
+        header["engine"] = "array"
+        header["numpy_random_state"] = world.rng.bit_generator.state
+        for name in ("infected", "alive", "being_treated", "immunity", "infection_progress", "home", "work", "current_building"):
+            arrays[name] = getattr(world, name)
+        if world.settings.track_positions:
+            arrays["position"] = world.position
+            arrays["target_position"] = world.target_position
+    else:
+        header["engine"] = "object"
+        people = world.people
+        arrays["infected"] = numpy.fromiter((i.infected for i in people), dtype=bool, count=len(people))
+        arrays["alive"] = numpy.fromiter((i.alive for i in people), dtype=bool, count=len(people))
+        arrays["being_treated"] = numpy.fromiter((i.being_treated for i in people), dtype=bool, count=len(people))
+        #immunity as it was set and the tick it was set at (see Person.immunity), so loaded immunities decay to the exact same values
+        arrays["immunity"] = numpy.fromiter((i.immunity_value for i in people), dtype=numpy.float64, count=len(people))
+        arrays["immunity_tick"] = numpy.fromiter((i.immunity_tick for i in people), dtype=numpy.int64, count=len(people))
+        arrays["infection_progress"] = numpy.fromiter((i.infection_progress for i in people), dtype=numpy.int32, count=len(people))
+        arrays["home"] = numpy.fromiter((building_id[id(i.home)] for i in people), dtype=numpy.int32, count=len(people))
+        arrays["work"] = numpy.fromiter((building_id[id(i.work)] for i in people), dtype=numpy.int32, count=len(people))
+        arrays["current_building"] = numpy.fromiter((building_id[id(i.current_building)] for i in people), dtype=numpy.int32, count=len(people))
+        #order of people inside buildings and of the free building sets decides which random choices are made
+        arrays["building_slot"] = numpy.fromiter((i.building_slot for i in people), dtype=numpy.int32, count=len(people))
+        if world.settings.track_positions:
+            arrays["position"] = numpy.array([i.position.tuple() for i in people], dtype=numpy.float64).reshape(len(people), 2)
+            arrays["target_position"] = numpy.array([i.target_position.tuple() for i in people], dtype=numpy.float64).reshape(len(people), 2)
+        #the order active people are visited in also decides which random choices are made
+        person_id = {id(person): index for index, person in enumerate(people)}
+        arrays["active_people"] = numpy.array([person_id[id(i)] for i in world.active_people], dtype=numpy.int32)
+        arrays["free_buildings"] = numpy.array([building_id[id(i)] for type in Simulation.Building_Types for i in world.free_buildings[type]], dtype=numpy.int32)
+        header["free_building_counts"] = [len(world.free_buildings[type]) for type in Simulation.Building_Types]
+
+    #lay out the arrays
+    offset = 0
+    header["arrays"] = {}
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // alignment) * alignment
+
+    header_bytes = json.dumps(header).encode()
+    data_start = -(-(len(magic) + 8 + len(header_bytes)) // alignment) * alignment
+    with open(path, "wb") as file:
+        file.write(magic)
+        file.write(len(header_bytes).to_bytes(8, "little"))
+        file.write(header_bytes)
+        for name, array in arrays.items():
+            file.seek(data_start + header["arrays"][name]["offset"])
+            file.write(numpy.ascontiguousarray(array).tobytes())
+        #pad the end so the last array is fully inside the file
+        file.truncate(data_start + offset)
+
+#reads the header and memory maps every array (copy on write, so changing them never touches the file)
+def read_snapshot(path:str) -> tuple[dict, dict[str, numpy.ndarray]]:
+    with open(path, "rb") as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a world snapshot")
+        header_length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_length))
+    if header["version"] != version:
+        raise ValueError(f"unsupported snapshot version {header['version']}")
+
+    data_start = -(-(len(magic) + 8 + header_length) // alignment) * alignment
+    arrays = {}
+    for name, description in header["arrays"].items():
+        shape = tuple(description["shape"])
+        if numpy.prod(shape) == 0:
+            arrays[name] = numpy.zeros(shape, dtype=description["dtype"])
+        else:
+            arrays[name] = numpy.memmap(path, dtype=description["dtype"], mode="c", offset=data_start + description["offset"], shape=shape)
+    return header, arrays
+
+#loads a world saved by save_world, as the same engine it was saved from
+#also restores the state of the random module (and the numpy generator of array worlds) unless restore_random_state is False
+def load_world(path:str, restore_random_state:bool = True) -> Simulation.World:
+    #the garbage collector would otherwise rescan the heap many times while hundreds of thousands of objects are created
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return read_world(path, restore_random_state)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def read_world(path:str, restore_random_state:bool) -> Simulation.World:
+    header, arrays = read_snapshot(path)
+
+    if header["engine"] == "array":
+        world = ArraySimulation.Array_World.__new__(ArraySimulation.Array_World)
+    else:
+        world = Simulation.World.__new__(Simulation.World)
+
+    world.settings = Simulation.World_Settings.from_dict(header["settings"])
+    world.day_length = sum(world.settings.day_phase_lengths)
+    world.time = header["time"]
+    world.day = header["day"]
+    world.paused = header["paused"]
+    world.compartment_counts = list(header["compartment_counts"])
+
+    #buildings
+    world.buildings = {}
+    for type in Simulation.Building_Types:
+        world.buildings[type] = []
+    world.building_grid = Simulation.Building_Grid()
+    buildings = []
+    types = list(Simulation.Building_Types)
+    for type, capacity, assigned, position, dimensions in zip(arrays["building_type"].tolist(), arrays["building_capacity"].tolist(), arrays["building_assigned"].tolist(), arrays["building_position"].tolist(), arrays["building_dimensions"].tolist()):
+        building = Simulation.Building(capacity, types[type], Vector2D(*position), Vector2D(*dimensions))
+        building.assigned = assigned
+        world.buildings[building.type].append(building)
+        world.building_grid.add(building)
+        buildings.append(building)
+    world.unassigned_buildings = {}
+    for type in (Simulation.Building_Types.HOUSE, Simulation.Building_Types.WORK):
+        world.unassigned_buildings[type] = Simulation.Random_Set(i for i in world.buildings[type] if i.capacity > i.assigned)
+
+    if header["engine"] == "array":
+        load_array_people(world, arrays)
+        if restore_random_state:
+            world.rng = numpy.random.default_rng()
+            world.rng.bit_generator.state = header["numpy_random_state"]
+        else:
+            world.rng = numpy.random.default_rng(random.getrandbits(64))
+    else:
+        load_object_people(world, buildings, arrays, header["free_building_counts"])
+
+    if restore_random_state:
+        version, state, gauss_next = header["random_state"]
+        random.setstate((version, tuple(state), gauss_next))
+    return world
+
+#rebuilds the Person objects of a Simulation.World
+def load_object_people(world:Simulation.World, buildings:list[Simulation.Building], arrays:dict[str, numpy.ndarray], free_building_counts:list[int]) -> None:
+    world.people = []
+    columns = zip(arrays["infected"].tolist(), arrays["alive"].tolist(), arrays["being_treated"].tolist(), arrays["immunity"].tolist(), arrays["infection_progress"].tolist(), arrays["home"].tolist(), arrays["work"].tolist(), arrays["current_building"].tolist(), arrays["building_slot"].tolist())
+    for infected, alive, being_treated, immunity, infection_progress, home, work, current_building, building_slot in columns:
+        #skips Person.__init__ since that would place the person in their home at a random position
+        person = Simulation.Person.__new__(Simulation.Person)
+        person.world = world
+        person.infected = infected
+        person.alive = alive
+        person.being_treated = being_treated
+        person.immunity_value = immunity
+        person.infection_progress = infection_progress
+        person.home = buildings[home]
+        person.work = buildings[work]
+        person.current_building = buildings[current_building]
+        person.building_slot = building_slot
+        person.id = len(world.people)
+        world.people.append(person)
+
+    #snapshots from before immunity decayed lazily hold the immunity at the time they were saved
+    immunity_ticks = arrays["immunity_tick"].tolist() if "immunity_tick" in arrays else [world.get_tick()] * len(world.people)
+    for person, immunity_tick in zip(world.people, immunity_ticks):
+        person.immunity_tick = immunity_tick
+
+    #worlds that dont keep positions have none saved
+    if "position" in arrays:
+        for person, position, target_position in zip(world.people, arrays["position"].tolist(), arrays["target_position"].tolist()):
+            person.target_position = Vector2D(*target_position)
+            #people that arrived share their position with their target, like in the world that was saved
+            person.position = person.target_position if position == target_position else Vector2D(*position)
+
+    #put living people back into their buildings in the same slots
+    occupants = numpy.bincount(arrays["current_building"][arrays["alive"]], minlength=len(buildings)).tolist()
+    for building, count in zip(buildings, occupants):
+        building.people.people = [None] * count
+    for person in world.people:
+        if person.alive:
+            person.current_building.people.people[person.building_slot] = person
+    infected = numpy.bincount(arrays["current_building"][arrays["alive"] & arrays["infected"]], minlength=len(buildings)).tolist()
+    for building, count in zip(buildings, infected):
+        building.people.infected = count
+
+    world.free_buildings = {}
+    free_buildings = iter(arrays["free_buildings"].tolist())
+    for type, count in zip(Simulation.Building_Types, free_building_counts):
+        world.free_buildings[type] = Simulation.Random_Set(buildings[next(free_buildings)] for i in range(count))
+    world.find_active_people()
+    if "active_people" in arrays:
+        world.active_people = {world.people[i]: None for i in arrays["active_people"].tolist()}
+
+#attaches the person arrays of an ArraySimulation.Array_World
+#arrays that already have the engines dtype stay memory mapped
+def load_array_people(world:ArraySimulation.Array_World, arrays:dict[str, numpy.ndarray]) -> None:
+    #the building table is already in the layout index_buildings() would build
+    world.building_list = world.get_all_buildings()
+    world.building_ids = {}
+    for type in Simulation.Building_Types:
+        world.building_ids[type] = numpy.flatnonzero(arrays["building_type"] == type.value)
+    world.building_capacity = arrays["building_capacity"].astype(numpy.int64)
+    world.building_position = arrays["building_position"].astype(numpy.int64, copy=False)
+    world.building_dimensions = arrays["building_dimensions"].astype(numpy.int64, copy=False)
+    for name, dtype in (("infected", bool), ("alive", bool), ("being_treated", bool), ("immunity", numpy.float64), ("infection_progress", numpy.int64), ("home", numpy.int64), ("work", numpy.int64), ("current_building", numpy.int64), ("position", numpy.float64), ("target_position", numpy.float64)):
+        #worlds that dont keep positions have none saved
+        if name in arrays:
+            setattr(world, name, arrays[name].astype(dtype, copy=False))
+    world.occupancy = numpy.bincount(world.current_building[world.alive], minlength=len(world.building_list))
+    world.people = ArraySimulation.People_Views(world)
+
+#saves a world part way through a run, loads it back and checks that both produce the same ticks afterwards
+def check_round_trip(engine:str, path:str, population:int = 500, ticks_before:int = 350, ticks_after:int = 400) -> None:
+    import Headless
+    settings = Simulation.World_Settings()
+    settings.building_layout = "packed"
+    settings.interaction_chance = 1/20
+    world = Headless.build_world(population, population // 20, settings, engine, seed=0)
+    for i in range(ticks_before):
+        world.tick()
+
+    world.save(path)
+    #run the original, then rewind to the snapshot (which restores the random state) and run the copy
+    original = []
+    for i in range(ticks_after):
+        world.tick()
+        original.append(world.compartments())
+    loaded = Simulation.World.load(path)
+    restored = []
+    for i in range(ticks_after):
+        loaded.tick()
+        restored.append(loaded.compartments())
+
+    if original != restored:
+        raise AssertionError(f"{engine} world diverged after loading")
+    for before, after in zip(world.people, loaded.people):
+        if (before.alive, before.infected, before.being_treated, before.immunity, before.infection_progress, before.position.tuple()) != (after.alive, after.infected, after.being_treated, after.immunity, after.infection_progress, after.position.tuple()):
+            raise AssertionError(f"{engine} world people diverged after loading")
+    print(f"{engine} engine: {ticks_after} ticks after loading match")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="world snapshot tools")
+    parser.add_argument("--check", action="store_true", help="check that saved and loaded worlds tick identically")
+    arguments = parser.parse_args()
+
+    if arguments.check:
+        with tempfile.TemporaryDirectory() as directory:
+            for engine in ("object", "array"):
+                check_round_trip(engine, os.path.join(directory, f"{engine}.world"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#parameter sweeps over World_Settings fields (and population/hospital capacity)
+#finished runs are cached on disk so re-running an overlapping sweep only computes the new cells
+#usage: python Sweep.py --population 5000 --hospital-capacity 100 --days 60 --replicates 10 --grid interaction_chance=[0.01,0.02] hospital_capacity=[50,100] --output sweep.csv
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import numpy
+import Simulation
+import Ensemble
+
+#files whose contents decide the results of a run, cached results from other versions of these are never reused
+code_files: tuple[str, ...] = ("Simulation.py", "ArraySimulation.py", "Vector2D.py", "Headless.py")
+
+#hash of the simulation source code
+def get_code_version() -> str:
+    code_hash = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in code_files:
+        with open(os.path.join(directory, name), "rb") as file:
+            code_hash.update(file.read())
+    return code_hash.hexdigest()[:16]
+
+#stable hash of everything that decides the result of a replicate
+def get_cache_key(replicate:Ensemble.Replicate, code_version:str) -> str:
+    description = {
+        "population": replicate.population,
+        "hospital_capacity": replicate.hospital_capacity,
+        "settings": replicate.settings,
+        "engine": replicate.engine,
+        "seed": replicate.seed,
+        "ticks": replicate.ticks,
+        "ticks_between_data_points": replicate.ticks_between_data_points,
+        "code_version": code_version,
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+#on disk cache of replicate results, one .npz file per result
+#the least recently used results are deleted once there are more than max_entries
+class Result_Cache:
+    directory: str
+    max_entries: int
+    entries: int
+
+    def __init__(self, directory:str = ".sweep_cache", max_entries:int = 10000) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self.entries = len(self.get_paths())
+
+    def get_paths(self) -> list[str]:
+        return [os.path.join(self.directory, i) for i in os.listdir(self.directory) if i.endswith(".npz")]
+
+    def get_path(self, key:str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    #returns (series, wall time) or None if the result isnt cached
+    def get(self, key:str) -> tuple[numpy.ndarray, float] | None:
+        path = self.get_path(key)
+        try:
+            with numpy.load(path) as data:
+                result = (data["series"], float(data["wall_time"]))
+        except (OSError, KeyError, ValueError):
+            return None
+
+        #mark as recently used
+        os.utime(path)
+        return result
+
+    def put(self, key:str, series:numpy.ndarray, wall_time:float) -> None:
+        path = self.get_path(key)
+        existed = os.path.exists(path)
+        #write to a temporary file first so a crash never leaves a half written result behind
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            numpy.savez(file, series=series, wall_time=wall_time)
+        os.replace(temporary_path, path)
+
+        if not existed:
+            self.entries += 1
+        if self.entries > self.max_entries:
+            self.evict()
+
+    #deletes the least recently used results until the cache is within max_entries
+    def evict(self) -> None:
+        paths = sorted(self.get_paths(), key=os.path.getmtime)
+        for path in paths[:max(len(paths) - self.max_entries, 0)]:
+            os.remove(path)
+        self.entries = min(len(paths), self.max_entries)
+
+#every combination of the given values, e.g. {"interaction_chance": [0.01, 0.02], "hospital_capacity": [50, 100]}
+def grid_design(parameters:dict[str, list]) -> list[dict]:
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*parameters.values())]
+
+#random points, each parameter is either a (low, high) tuple sampled uniformly (as an int if both are ints)
+#or a list of values to choose from
+def random_design(parameters:dict[str, tuple | list], samples:int, seed:int = 0) -> list[dict]:
+    generator = random.Random(seed)
+    points = []
+    for i in range(samples):
+        point = {}
+        for name, values in parameters.items():
+            if isinstance(values, list):
+                point[name] = generator.choice(values)
+            elif all(isinstance(i, int) for i in values):
+                point[name] = generator.randint(*values)
+            else:
+                point[name] = generator.uniform(*values)
+        points.append(point)
+    return points
+
+#result of one point of a sweep
+class Sweep_Cell:
+    #the overridden parameters
+    point: dict
+    result: Ensemble.Ensemble_Result
+    #number of replicates that were loaded from the cache
+    cached_replicates: int
+
+    def __init__(self, point:dict, result:Ensemble.Ensemble_Result, cached_replicates:int) -> None:
+        self.point = point
+        self.result = result
+        self.cached_replicates = cached_replicates
+
+#runs replicates of every point of a design, reusing cached results
+#points override fields of base_settings (in World_Settings.to_dict form) and may also set population and hospital_capacity
+def run_sweep(points:list[dict], population:int, hospital_capacity:int, base_settings:Simulation.World_Settings, replicates:int, ticks:int, engine:str = "array", ticks_between_data_points:int = 4, base_seed:int = 0, cache:Result_Cache | None = None, processes:int | None = None, progress:bool = True) -> list[Sweep_Cell]:
+    code_version = get_code_version()
+
+    #build every replicate of every point
+    cells = []
+    for point in points:
+        settings = base_settings.to_dict()
+        settings.update({name: value for name, value in point.items() if name not in ("population", "hospital_capacity")})
+        #round trip so the settings (and their hash) dont depend on how the point was written
+        settings = Simulation.World_Settings.from_dict(json.loads(json.dumps(settings))).to_dict()
+        jobs = [Ensemble.Replicate(point.get("population", population), point.get("hospital_capacity", hospital_capacity), settings, engine, base_seed + i, ticks, ticks_between_data_points) for i in range(replicates)]
+        cells.append((point, jobs, [get_cache_key(i, code_version) for i in jobs]))
+
+    #load what we can from the cache
+    results = {}
+    for point, jobs, keys in cells:
+        for key in keys:
+            if cache != None and key not in results:
+                cached = cache.get(key)
+                if cached != None:
+                    results[key] = cached
+
+    #run the rest (each unique replicate once, even if several points share it)
+    missing = {}
+    for point, jobs, keys in cells:
+        for job, key in zip(jobs, keys):
+            if key not in results:
+                missing[key] = job
+    if progress:
+        print(f"{len(missing)} replicates to run, {len(results)} cached", file=sys.stderr)
+
+    #results are cached as soon as each replicate finishes so an interrupted sweep keeps its progress
+    keys = list(missing)
+    def on_result(index:int, result:tuple[int, numpy.ndarray, float]) -> None:
+        seed, series, wall_time = result
+        results[keys[index]] = (series, wall_time)
+        if cache != None:
+            cache.put(keys[index], series, wall_time)
+    if len(missing) > 0:
+        Ensemble.run_replicates(list(missing.values()), processes, progress, on_result)
+
+    output = []
+    for point, jobs, keys in cells:
+        output.append(Sweep_Cell(point, Ensemble.Ensemble_Result(numpy.stack([results[i][0] for i in keys]), [i.seed for i in jobs], [results[i][1] for i in keys], ticks_between_data_points), sum(key not in missing for key in keys)))
+    return output
+
+#parses "name=value" arguments where value is json, e.g. interaction_chance=[0.01,0.02]
+def parse_parameters(arguments:list[str]) -> dict:
+    output = {}
+    for argument in arguments:
+        name, value = argument.split("=", 1)
+        output[name] = json.loads(value)
+    return output
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="sweep simulation parameters, reusing cached runs")
+    parser.add_argument("--population", type=int, required=True)
+    parser.add_argument("--hospital-capacity", type=int, required=True)
+    parser.add_argument("--settings", help="json file of base World_Settings fields (see World_Settings.to_dict)")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--ticks", type=int)
+    length.add_argument("--days", type=int)
+    design = parser.add_mutually_exclusive_group(required=True)
+    design.add_argument("--grid", nargs="+", metavar="NAME=[VALUES]", help="every combination of the listed values")
+    design.add_argument("--random", nargs="+", metavar="NAME=[LOW,HIGH]", help="uniform ranges sampled --samples times")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--replicates", type=int, default=10)
+    parser.add_argument("--base-seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, help="defaults to the number of cores")
+    parser.add_argument("--engine", choices=("object", "array"), default="array")
+    parser.add_argument("--ticks-between-data-points", type=int, default=4)
+    parser.add_argument("--cache", default=".sweep_cache", help="cache directory")
+    parser.add_argument("--cache-size", type=int, default=10000, help="maximum number of cached replicates")
+    parser.add_argument("--output", required=True, help="csv file with a row per point")
+    arguments = parser.parse_args()
+
+    if arguments.settings != None:
+        with open(arguments.settings) as file:
+            settings = Simulation.World_Settings.from_dict(json.load(file))
+    else:
+        settings = Simulation.World_Settings()
+    ticks = arguments.ticks if arguments.ticks != None else arguments.days * sum(settings.day_phase_lengths)
+
+    if arguments.grid != None:
+        points = grid_design(parse_parameters(arguments.grid))
+    else:
+        points = random_design({name: tuple(value) for name, value in parse_parameters(arguments.random).items()}, arguments.samples, arguments.base_seed)
+
+    cache = Result_Cache(arguments.cache, arguments.cache_size)
+    cells = run_sweep(points, arguments.population, arguments.hospital_capacity, settings, arguments.replicates, ticks, arguments.engine, arguments.ticks_between_data_points, arguments.base_seed, cache, arguments.processes)
+
+    #one row per point with the mean peak and final size of each compartment
+    names = list(points[0]) if len(points) > 0 else []
+    compartment_names = [i.name.lower() for i in Simulation.Compartments]
+    with open(arguments.output, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(names + [f"peak_{i}" for i in compartment_names] + [f"final_{i}" for i in compartment_names] + ["cached_replicates"])
+        for cell in cells:
+            series = cell.result.series
+            writer.writerow([json.dumps(cell.point[i]) for i in names] + series.max(axis=1).mean(axis=0).round(3).tolist() + series[:, -1].mean(axis=0).round(3).tolist() + [cell.cached_replicates])
+
+if __name__ == "__main__":
+    main()
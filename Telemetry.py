@@ -0,0 +1,253 @@
+#live telemetry of a running world over http and websockets, to watch long runs from a browser or another machine
+#an asyncio server runs in a background thread, the simulation hands it the state of the world with publish()
+#publish() only copies a few counters (and the occupancy of every building) at most rate times per second and never waits on clients
+#every websocket client gets the latest state when it is ready for more, so a slow client skips states instead of backing anything up
+#
+#endpoints:
+#   GET /            page that shows the stream
+#   GET /telemetry   latest state as json
+#   GET /buildings   type, position and dimensions of every building, building ids are indices into "occupancy"
+#   GET /stream      websocket, the latest state as a json text message each time one is published
+#usage: python Headless.py --population 100000 --hospital-capacity 1000 --days 60 --telemetry-port 8765
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import time
+import Simulation
+
+#appended to the key of a websocket handshake before hashing it (RFC 6455)
+websocket_guid: bytes = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+#messages from clients are only ever close, ping and pong frames, anything bigger than this closes the connection
+max_client_frame: int = 1 << 16
+
+phase_names: tuple[str, ...] = ("work", "misc", "home")
+
+page: bytes = b"""<!doctype html>
+<title>simulation telemetry</title>
+<pre id="state">connecting</pre>
+<script>
+const state = document.getElementById("state");
+const socket = new WebSocket(`ws://${location.host}/stream`);
+socket.onmessage = event => {
+    const data = JSON.parse(event.data);
+    delete data.occupancy;
+    state.textContent = JSON.stringify(data, null, 1);
+};
+socket.onclose = () => state.textContent += "\\ndisconnected";
+</script>
+"""
+
+#state of a world to publish, everything in it is a copy so the world can keep ticking while it is encoded
+#occupancy is the number of living people in each building (by id), or None
+def get_telemetry(world:Simulation.World, buildings:list[Simulation.Building] | None, ticks_per_second:float) -> dict:
+    telemetry = {
+        "tick": world.get_tick(),
+        "day": world.day,
+        "time": world.time,
+        "phase": phase_names[world.get_current_phase()],
+        "paused": world.paused,
+        "ticks_per_second": round(ticks_per_second, 2),
+        "compartments": dict(zip((i.name.lower() for i in Simulation.Compartments), world.compartments())),
+        "occupancy": None,
+    }
+    if buildings != None:
+        #array worlds (and remote ones) count the occupants of every building already, copied since the worker reuses its buffers
+        if hasattr(world, "occupancy"):
+            telemetry["occupancy"] = world.occupancy.copy()
+        else:
+            telemetry["occupancy"] = [len(i.people) for i in buildings]
+    return telemetry
+
+#a websocket frame from the server (unmasked, not fragmented)
+def encode_frame(opcode:int, payload:bytes) -> bytes:
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+    return header + payload
+
+#reads a websocket frame from a client, returns (opcode, payload)
+async def read_frame(reader:asyncio.StreamReader) -> tuple[int, bytes]:
+    header = await reader.readexactly(2)
+    opcode = header[0] & 0x0f
+    length = header[1] & 0x7f
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+    if length > max_client_frame:
+        raise ConnectionError("websocket frame too big")
+    mask = await reader.readexactly(4) if header[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask != None:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return opcode, payload
+
+class Telemetry_Server:
+    host: str
+    port: int
+    #seconds between published states
+    interval: float
+    #buildings in id order for the occupancy of object worlds, None if occupancy isnt published
+    buildings: list[Simulation.Building] | None
+    buildings_json: bytes
+
+    loop: asyncio.AbstractEventLoop
+    thread: threading.Thread
+    #latest published state as json, version counts the published states
+    #only touched by the server thread
+    latest: bytes = b"null"
+    version: int = 0
+    #set (and replaced) every time a state is published
+    updated: asyncio.Event
+
+    #for ticks_per_second and rate limiting, only touched by the simulation thread
+    last_publish_time: float = 0.
+    last_publish_tick: int = 0
+
+    #starts serving on host:port (port 0 picks a free port, see port), publishing at most rate states per second
+    def __init__(self, world:Simulation.World, host:str = "127.0.0.1", port:int = 8765, rate:float = 2., occupancy:bool = True) -> None:
+        self.host = host
+        self.port = port
+        self.interval = 1 / rate
+        all_buildings = world.get_all_buildings()
+        self.buildings = all_buildings if occupancy else None
+        self.buildings_json = json.dumps([{"type": i.type.name.lower(), "position": i.position.tuple(), "dimensions": i.dimensions.tuple()} for i in all_buildings]).encode()
+
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+        self.thread = threading.Thread(target=self.run_loop, args=(started, errors), daemon=True)
+        self.thread.start()
+        started.wait()
+        if len(errors) > 0:
+            raise errors[0]
+
+        self.last_publish_time = time.perf_counter()
+        self.last_publish_tick = world.get_tick()
+        self.publish(world, force=True)
+
+    def run_loop(self, started:threading.Event, errors:list[Exception]) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.updated = asyncio.Event()
+        try:
+            server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, self.host, self.port))
+        except OSError as error:
+            errors.append(error)
+            self.loop.close()
+            started.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        started.set()
+
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    #hands the state of the world to the server if a state is due (or force is set), returns whether it did
+    #called from the thread that ticks the world, costs a clock read when no state is due
+    def publish(self, world:Simulation.World, force:bool = False) -> bool:
+        now = time.perf_counter()
+        if not force and now - self.last_publish_time < self.interval:
+            return False
+
+        tick = world.get_tick()
+        ticks_per_second = (tick - self.last_publish_tick) / max(now - self.last_publish_time, 1e-9)
+        self.last_publish_time = now
+        self.last_publish_tick = tick
+        telemetry = get_telemetry(world, self.buildings, ticks_per_second)
+        self.loop.call_soon_threadsafe(self.set_latest, telemetry)
+        return True
+
+    #runs on the server thread, encodes the state once for every client and wakes the clients up
+    def set_latest(self, telemetry:dict) -> None:
+        if telemetry["occupancy"] is not None and not isinstance(telemetry["occupancy"], list):
+            telemetry["occupancy"] = telemetry["occupancy"].tolist()
+        telemetry["wall_time"] = time.time()
+        self.latest = json.dumps(telemetry).encode()
+        self.version += 1
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    async def handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            method, path, protocol = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            path = path.split("?", 1)[0]
+
+            if method != "GET":
+                self.respond(writer, "405 Method Not Allowed", "text/plain", b"only GET is supported")
+            elif path == "/stream" and headers.get("upgrade", "").lower() == "websocket":
+                await self.stream(reader, writer, headers.get("sec-websocket-key", ""))
+            elif path == "/":
+                self.respond(writer, "200 OK", "text/html", page)
+            elif path == "/telemetry":
+                self.respond(writer, "200 OK", "application/json", self.latest)
+            elif path == "/buildings":
+                self.respond(writer, "200 OK", "application/json", self.buildings_json)
+            else:
+                self.respond(writer, "404 Not Found", "text/plain", b"not found")
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer:asyncio.StreamWriter, status:str, content_type:str, body:bytes) -> None:
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nAccess-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n".encode() + body)
+
+    #websocket connection, states are sent by send_states while this reads the frames of the client until it closes
+    async def stream(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter, key:str) -> None:
+        accept = base64.b64encode(hashlib.sha1(key.encode() + websocket_guid).digest()).decode()
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n".encode())
+
+        sending = asyncio.ensure_future(self.send_states(writer))
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                #close
+                if opcode == 0x8:
+                    writer.write(encode_frame(0x8, payload[:2]))
+                    break
+                #ping
+                elif opcode == 0x9:
+                    writer.write(encode_frame(0xa, payload))
+        finally:
+            sending.cancel()
+
+    #sends the latest state whenever there is a newer one than the one sent last
+    #while a slow client is still taking in a state (drain() waits) newer states replace each other, so only the latest is sent next
+    async def send_states(self, writer:asyncio.StreamWriter) -> None:
+        version = 0
+        try:
+            while True:
+                if version == self.version:
+                    await self.updated.wait()
+                version = self.version
+                writer.write(encode_frame(0x1, self.latest))
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    #stops serving and closes every connection
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
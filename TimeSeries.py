@@ -0,0 +1,181 @@
+#memory bounded, on disk store for the data points of a simulation
+#
+#data points are appended into fixed size chunks in memory, full chunks are spilled to append only files
+#besides the raw data points, the store keeps downsampled levels of fixed length buckets (e.g. per day and per week)
+#so any window of the history can be read at a chosen resolution without loading the rest of it
+#
+#files in the store directory:
+#   store.json  - columns, chunk size and bucket length of each level
+#   raw.bin     - int64 rows of (tick, value for each column)
+#   <level>.bin - float64 rows of (first tick of the bucket, number of data points, mean of each column, min of each column, max of each column)
+import json
+import os
+import numpy
+
+class Time_Series_Store:
+    directory: str
+    columns: int
+    chunk_size: int
+    #ticks per bucket of each downsampled level
+    levels: dict[str, int]
+
+    #in memory tail of each level that hasnt been spilled to disk yet
+    chunks: dict[str, numpy.ndarray]
+    chunk_lengths: dict[str, int]
+    #rows of each level already on disk
+    stored_rows: dict[str, int]
+    files: dict[str, object]
+    #cached memory maps of the files, (rows mapped, map)
+    maps: dict[str, tuple[int, numpy.ndarray]]
+
+    #bucket currently being filled for each downsampled level, (bucket index, count, sum, min, max)
+    buckets: dict[str, tuple[int, int, numpy.ndarray, numpy.ndarray, numpy.ndarray] | None]
+
+    #opens the store in directory, continuing it if it already exists
+    #levels maps level names to bucket lengths in ticks, e.g. {"day": 100, "week": 700}
+    def __init__(self, directory:str, levels:dict[str, int], columns:int = 5, chunk_size:int = 4096) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        metadata_path = os.path.join(directory, "store.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+            columns = metadata["columns"]
+            levels = metadata["levels"]
+        else:
+            with open(metadata_path, "w") as file:
+                json.dump({"columns": columns, "levels": levels, "chunk_size": chunk_size}, file)
+
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.levels = dict(levels)
+        self.chunks = {}
+        self.chunk_lengths = {}
+        self.stored_rows = {}
+        self.files = {}
+        self.maps = {}
+        self.buckets = {}
+        for level in self.get_level_names():
+            self.chunks[level] = numpy.zeros((chunk_size, self.get_row_width(level)), dtype=self.get_dtype(level))
+            self.chunk_lengths[level] = 0
+            self.files[level] = open(self.get_path(level), "ab")
+            self.stored_rows[level] = os.path.getsize(self.get_path(level)) // (self.get_row_width(level) * 8)
+            self.buckets[level] = None
+
+    def get_level_names(self) -> list[str]:
+        return ["raw"] + list(self.levels)
+
+    def get_path(self, level:str) -> str:
+        return os.path.join(self.directory, f"{level}.bin")
+
+    def get_row_width(self, level:str) -> int:
+        return 1 + self.columns if level == "raw" else 2 + 3 * self.columns
+
+    def get_dtype(self, level:str) -> type:
+        return numpy.int64 if level == "raw" else numpy.float64
+
+    #number of rows in a level
+    def get_length(self, level:str = "raw") -> int:
+        return self.stored_rows[level] + self.chunk_lengths[level]
+
+    def __len__(self) -> int:
+        return self.get_length("raw")
+
+    #adds a data point, ticks must be increasing
+    def append(self, tick:int, values:tuple[int, ...]) -> None:
+        self.append_row("raw", (tick,) + tuple(values))
+
+        values = numpy.asarray(values, dtype=numpy.float64)
+        for level, bucket_length in self.levels.items():
+            index = tick // bucket_length
+            bucket = self.buckets[level]
+            if bucket != None and bucket[0] != index:
+                self.finish_bucket(level)
+                bucket = None
+
+            if bucket == None:
+                self.buckets[level] = (index, 1, values.copy(), values.copy(), values.copy())
+            else:
+                numpy.add(bucket[2], values, out=bucket[2])
+                numpy.minimum(bucket[3], values, out=bucket[3])
+                numpy.maximum(bucket[4], values, out=bucket[4])
+                self.buckets[level] = (index, bucket[1] + 1, bucket[2], bucket[3], bucket[4])
+
+    def finish_bucket(self, level:str) -> None:
+        index, count, total, minimum, maximum = self.buckets[level]
+        row = numpy.concatenate(((index * self.levels[level], count), total / count, minimum, maximum))
+        self.append_row(level, row)
+        self.buckets[level] = None
+
+    def append_row(self, level:str, row) -> None:
+        self.chunks[level][self.chunk_lengths[level]] = row
+        self.chunk_lengths[level] += 1
+        if self.chunk_lengths[level] == self.chunk_size:
+            self.spill(level)
+
+    #writes the in memory rows of a level to its file
+    def spill(self, level:str) -> None:
+        length = self.chunk_lengths[level]
+        if length == 0:
+            return
+        self.files[level].write(self.chunks[level][:length].tobytes())
+        self.files[level].flush()
+        self.stored_rows[level] += length
+        self.chunk_lengths[level] = 0
+
+    def flush(self) -> None:
+        for level in self.get_level_names():
+            self.spill(level)
+
+    def close(self) -> None:
+        self.flush()
+        for file in self.files.values():
+            file.close()
+        self.maps = {}
+
+    #memory map of the rows of a level that are on disk
+    def get_stored(self, level:str) -> numpy.ndarray:
+        rows = self.stored_rows[level]
+        if rows == 0:
+            return numpy.zeros((0, self.get_row_width(level)), dtype=self.get_dtype(level))
+        if level not in self.maps or self.maps[level][0] != rows:
+            self.maps[level] = (rows, numpy.memmap(self.get_path(level), dtype=self.get_dtype(level), mode="r", shape=(rows, self.get_row_width(level))))
+        return self.maps[level][1]
+
+    #in memory rows of a level that havent been spilled yet
+    def get_unstored(self, level:str) -> numpy.ndarray:
+        return self.chunks[level][:self.chunk_lengths[level]]
+
+    #index range of the rows with start_tick <= tick < end_tick (tick is the first column)
+    def get_window(rows:numpy.ndarray, start_tick:int | None, end_tick:int | None) -> tuple[int, int]:
+        start = 0 if start_tick == None else int(numpy.searchsorted(rows[:, 0], start_tick, "left"))
+        end = len(rows) if end_tick == None else int(numpy.searchsorted(rows[:, 0], end_tick, "left"))
+        return start, end
+
+    #rows of a level with start_tick <= tick < end_tick
+    #only the parts of the file inside the window are read
+    def read(self, level:str = "raw", start_tick:int | None = None, end_tick:int | None = None) -> numpy.ndarray:
+        parts = []
+        for rows in (self.get_stored(level), self.get_unstored(level)):
+            start, end = Time_Series_Store.get_window(rows, start_tick, end_tick)
+            parts.append(numpy.array(rows[start:end]))
+        return numpy.concatenate(parts)
+
+    #like read() but returns (ticks, values) with the raw values or the bucket means
+    def read_values(self, level:str = "raw", start_tick:int | None = None, end_tick:int | None = None) -> tuple[numpy.ndarray, numpy.ndarray]:
+        rows = self.read(level, start_tick, end_tick)
+        if level == "raw":
+            return rows[:, 0], rows[:, 1:]
+        return rows[:, 0], rows[:, 2:2 + self.columns]
+
+    #finest level that has at most max_rows rows between start_tick and end_tick (or the coarsest level)
+    def choose_level(self, max_rows:int, start_tick:int | None = None, end_tick:int | None = None) -> str:
+        for level in self.get_level_names():
+            count = 0
+            for rows in (self.get_stored(level), self.get_unstored(level)):
+                start, end = Time_Series_Store.get_window(rows, start_tick, end_tick)
+                count += end - start
+            if count <= max_rows:
+                return level
+        return self.get_level_names()[-1]
@@ -0,0 +1,245 @@
+#optional log of who infected whom, where and when, for reproduction number estimates and superspreader analysis
+#attach a recorder with world.transmissions = Transmission_Recorder(world, path), every infection is then recorded as
+#(tick, source id, target id, building id, building type), people that were already infected when recording started have source -1
+#people are identified by their index in world.people and buildings by their index in get_all_buildings()
+#
+#events are kept in a preallocated ring of the latest capacity events and/or appended to a file in chunks
+#file layout:
+#   magic (8 bytes) | header length (uint64 little endian) | json header | events (packed records of event_dtype)
+#
+#usage: python Transmissions.py run.transmissions --tree tree.csv --reproduction rt.csv
+import argparse
+import csv
+import json
+import sys
+import numpy
+import Simulation
+
+magic: bytes = b"INFECTED"
+version: int = 1
+
+event_dtype: numpy.dtype = numpy.dtype([("tick", numpy.int64), ("source", numpy.int64), ("target", numpy.int64), ("building", numpy.int64), ("building_type", numpy.int8)])
+
+class Transmission_Recorder:
+    #events that arent in the ring or file yet, single events are appended as tuples since that is much cheaper than writing into an array
+    pending: list[tuple[int, int, int, int, int]]
+    chunk_size: int
+    #latest capacity events, oldest first starting at ring_start once it wrapped around, None if capacity is 0
+    ring: numpy.ndarray | None
+    ring_start: int = 0
+    #number of events recorded, including ones that dropped out of the ring
+    count: int = 0
+    file: object = None
+    day_length: int
+    #index of every building object (for the object engine) and type of every building id
+    building_ids: dict[Simulation.Building, int]
+    building_types: numpy.ndarray
+
+    #path is a file to append every event to, capacity is the number of events kept in memory
+    def __init__(self, world:Simulation.World, path:str | None = None, capacity:int = 1000000, chunk_size:int = 4096) -> None:
+        buildings = world.get_all_buildings()
+        self.building_ids = {building: index for index, building in enumerate(buildings)}
+        self.building_types = numpy.array([i.type.value for i in buildings], dtype=numpy.int8)
+        self.day_length = world.day_length
+        self.pending = []
+        self.chunk_size = chunk_size
+        self.ring = numpy.zeros(capacity, dtype=event_dtype) if capacity > 0 else None
+
+        if path != None:
+            self.file = open(path, "wb")
+            header = json.dumps({"version": version, "dtype": event_dtype.descr, "day_length": world.day_length}).encode()
+            self.file.write(magic + len(header).to_bytes(8, "little") + header)
+
+        #roots of the infection tree
+        tick = world.get_tick()
+        if hasattr(world, "rng"):
+            infected = numpy.flatnonzero(world.alive & world.infected)
+            self.record_many(tick, numpy.full(len(infected), -1), infected, world.current_building[infected])
+        else:
+            for person in world.people:
+                if person.alive and person.infected:
+                    self.record(tick, None, person)
+
+    #records an infection of the object engine, source is None for people that didnt get infected by anyone
+    def record(self, tick:int, source:Simulation.Person | None, target:Simulation.Person) -> None:
+        building = target.current_building
+        self.pending.append((tick, -1 if source == None else source.id, target.id, self.building_ids[building], building.type.value))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    #records infections of the array engine, given as arrays of person and building ids
+    def record_many(self, tick:int, sources:numpy.ndarray, targets:numpy.ndarray, buildings:numpy.ndarray) -> None:
+        if len(targets) == 0:
+            return
+        self.flush()
+        events = numpy.empty(len(targets), dtype=event_dtype)
+        events["tick"] = tick
+        events["source"] = sources
+        events["target"] = targets
+        events["building"] = buildings
+        events["building_type"] = self.building_types[buildings]
+        self.write(events)
+
+    #moves the pending events into the ring and file
+    def flush(self) -> None:
+        if len(self.pending) > 0:
+            events = numpy.array(self.pending, dtype=event_dtype)
+            self.pending = []
+            self.write(events)
+
+    def write(self, events:numpy.ndarray) -> None:
+        self.count += len(events)
+        if self.file != None:
+            events.tofile(self.file)
+        if self.ring is None:
+            return
+
+        #only the latest events fit if there are more than the whole ring
+        capacity = len(self.ring)
+        events = events[-capacity:]
+        end = self.ring_start + len(events)
+        first = min(end, capacity) - self.ring_start
+        self.ring[self.ring_start:self.ring_start + first] = events[:first]
+        self.ring[:len(events) - first] = events[first:]
+        self.ring_start = end % capacity
+
+    #events still in memory, oldest first
+    def get_events(self) -> numpy.ndarray:
+        self.flush()
+        if self.ring is None:
+            return numpy.zeros(0, dtype=event_dtype)
+        if self.count < len(self.ring):
+            return self.ring[:self.count].copy()
+        return numpy.concatenate((self.ring[self.ring_start:], self.ring[:self.ring_start]))
+
+    def close(self) -> None:
+        self.flush()
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+#reads the header of a transmission log, returns (header, offset of the first event)
+def read_header(path:str) -> tuple[dict, int]:
+    with open(path, "rb") as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a transmission log")
+        header_length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_length))
+    if header["version"] != version:
+        raise ValueError(f"unsupported transmission log version {header['version']}")
+    return header, len(magic) + 8 + header_length
+
+#events of a transmission log in chunks of up to chunk_size events, so logs bigger than memory can be read
+def read_events(path:str, chunk_size:int = 1 << 20):
+    header, offset = read_header(path)
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while True:
+            events = numpy.fromfile(file, dtype=event_dtype, count=chunk_size)
+            if len(events) == 0:
+                break
+            yield events
+
+#infections as a tree, built in one pass over the events in the order they were recorded
+#the nodes are infections rather than people since people can be infected again once their immunity wears off
+class Infection_Tree:
+    #per infection (in the order they were recorded)
+    ticks: numpy.ndarray
+    people: numpy.ndarray
+    buildings: numpy.ndarray
+    building_types: numpy.ndarray
+    #infection the source was in when they passed it on, -1 for the roots
+    parents: numpy.ndarray
+    #number of infections each infection passed on
+    offspring: numpy.ndarray
+
+    def __init__(self, chunks) -> None:
+        ticks = []
+        people = []
+        buildings = []
+        building_types = []
+        parents = []
+        #latest infection of every person seen so far
+        current_infection = {}
+        for events in chunks:
+            first = len(people)
+            ticks.append(events["tick"])
+            people.extend(events["target"].tolist())
+            buildings.append(events["building"])
+            building_types.append(events["building_type"])
+            for index, (source, target) in enumerate(zip(events["source"].tolist(), events["target"].tolist()), first):
+                parents.append(current_infection.get(source, -1))
+                current_infection[target] = index
+
+        self.ticks = numpy.concatenate(ticks) if len(ticks) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        self.people = numpy.array(people, dtype=numpy.int64)
+        self.buildings = numpy.concatenate(buildings) if len(buildings) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        self.building_types = numpy.concatenate(building_types) if len(building_types) > 0 else numpy.zeros(0, dtype=numpy.int8)
+        self.parents = numpy.array(parents, dtype=numpy.int64)
+        self.offspring = numpy.bincount(self.parents[self.parents >= 0], minlength=len(self.parents))
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    #infections passed on by an infection
+    def get_children(self, infection:int) -> numpy.ndarray:
+        return numpy.flatnonzero(self.parents == infection)
+
+    #number of infections between an infection and its root (roots are generation 0)
+    def get_generations(self) -> numpy.ndarray:
+        generations = numpy.zeros(len(self.parents), dtype=numpy.int64)
+        #parents are always recorded before their children
+        for index, parent in enumerate(self.parents.tolist()):
+            if parent >= 0:
+                generations[index] = generations[parent] + 1
+        return generations
+
+    #the count infections that passed on the most, as (infection, offspring) sorted by offspring
+    def get_top_spreaders(self, count:int = 10) -> list[tuple[int, int]]:
+        order = numpy.argsort(-self.offspring, kind="stable")[:count]
+        return list(zip(order.tolist(), self.offspring[order].tolist()))
+
+    #reproduction number of each day: the mean number of infections passed on by the people infected that day
+    #returns (days, infections on each day, reproduction number of each day)
+    #days near the end of the log are too low since those infections havent finished passing it on
+    def get_daily_reproduction_numbers(self, day_length:int) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        days = self.ticks // day_length
+        day_count = int(days.max()) + 1 if len(days) > 0 else 0
+        infections = numpy.bincount(days, minlength=day_count)
+        passed_on = numpy.bincount(days, weights=self.offspring, minlength=day_count)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            reproduction_numbers = passed_on / infections
+        return numpy.arange(day_count), infections, reproduction_numbers
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="rebuild the infection tree and daily reproduction numbers from a transmission log")
+    parser.add_argument("log")
+    parser.add_argument("--tree", help="csv file of every infection with its parent infection")
+    parser.add_argument("--reproduction", help="csv file of the reproduction number of every day")
+    parser.add_argument("--top", type=int, default=10, help="number of top spreaders to print")
+    arguments = parser.parse_args()
+
+    header, offset = read_header(arguments.log)
+    tree = Infection_Tree(read_events(arguments.log))
+    days, infections, reproduction_numbers = tree.get_daily_reproduction_numbers(header["day_length"])
+
+    if arguments.tree != None:
+        generations = tree.get_generations()
+        with open(arguments.tree, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("infection", "tick", "person", "parent", "building", "building_type", "generation", "offspring"))
+            building_types = [i.name.lower() for i in Simulation.Building_Types]
+            for row in zip(range(len(tree)), tree.ticks.tolist(), tree.people.tolist(), tree.parents.tolist(), tree.buildings.tolist(), tree.building_types.tolist(), generations.tolist(), tree.offspring.tolist()):
+                writer.writerow(row[:5] + (building_types[row[5]],) + row[6:])
+    if arguments.reproduction != None:
+        with open(arguments.reproduction, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("day", "infections", "reproduction_number"))
+            for day, count, reproduction_number in zip(days.tolist(), infections.tolist(), reproduction_numbers.tolist()):
+                writer.writerow((day, count, round(reproduction_number, 4) if count > 0 else ""))
+
+    print(f"{len(tree)} infections, {int(numpy.count_nonzero(tree.parents < 0))} roots, {int(tree.get_generations().max(initial=0))} generations", file=sys.stderr)
+    print("top spreaders (infection: offspring): " + ", ".join(f"{infection}: {offspring}" for infection, offspring in tree.get_top_spreaders(arguments.top)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#checks that transmission_mode "batch" gives the same epidemics as the per person ("agent") transmission
+#runs an ensemble of each and compares the distributions of a few summary statistics with two sample kolmogorov-smirnov tests
+#usage: python Validation.py --population 5000 --hospital-capacity 100 --days 60 --replicates 100
+import argparse
+import copy
+import sys
+import numpy
+import Simulation
+import Ensemble
+import Headless
+
+#summary statistics of each replicate of an ensemble as {name: array of shape (replicates,)}
+def summarize(result:Ensemble.Ensemble_Result) -> dict[str, numpy.ndarray]:
+    series = result.series
+    sick = series[:, :, Simulation.Compartments.INFECTED.value] + series[:, :, Simulation.Compartments.HOSPITALIZED.value]
+    return {
+        "peak_sick": sick.max(axis=1),
+        "peak_tick": result.ticks()[sick.argmax(axis=1)],
+        "final_susceptible": series[:, -1, Simulation.Compartments.SUSCEPTIBLE.value],
+        "final_immune": series[:, -1, Simulation.Compartments.IMMUNE.value],
+        "final_dead": series[:, -1, Simulation.Compartments.DEAD.value],
+    }
+
+#two sample kolmogorov-smirnov test, returns (largest distance between the two empirical distributions, p value)
+#the p value uses the asymptotic kolmogorov distribution, so it is only approximate for small samples
+def ks_test(a:numpy.ndarray, b:numpy.ndarray) -> tuple[float, float]:
+    a = numpy.sort(a)
+    b = numpy.sort(b)
+    values = numpy.concatenate((a, b))
+    distance = float(numpy.max(numpy.abs(numpy.searchsorted(a, values, side="right") / len(a) - numpy.searchsorted(b, values, side="right") / len(b))))
+
+    effective_size = len(a) * len(b) / (len(a) + len(b))
+    scale = (numpy.sqrt(effective_size) + 0.12 + 0.11 / numpy.sqrt(effective_size)) * distance
+    if scale < 1e-3:
+        return distance, 1.
+    terms = numpy.arange(1, 101)
+    p_value = 2 * numpy.sum((-1.)**(terms - 1) * numpy.exp(-2 * terms**2 * scale**2))
+    return distance, float(numpy.clip(p_value, 0, 1))
+
+#compares the summary statistics of two ensembles
+#returns a row per statistic: (name, mean of a, mean of b, ks distance, p value)
+def compare(a:Ensemble.Ensemble_Result, b:Ensemble.Ensemble_Result) -> list[tuple[str, float, float, float, float]]:
+    summary_a = summarize(a)
+    summary_b = summarize(b)
+    rows = []
+    for name in summary_a:
+        distance, p_value = ks_test(summary_a[name], summary_b[name])
+        rows.append((name, float(summary_a[name].mean()), float(summary_b[name].mean()), distance, p_value))
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="compare the batched transmission mode against the per person one")
+    parser.add_argument("--population", type=int, required=True)
+    parser.add_argument("--hospital-capacity", type=int, required=True)
+    parser.add_argument("--settings", help="json file of World_Settings fields (see World_Settings.to_dict)")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--ticks", type=int)
+    length.add_argument("--days", type=int)
+    parser.add_argument("--replicates", type=int, default=100)
+    parser.add_argument("--base-seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, help="defaults to the number of cores")
+    parser.add_argument("--engine", choices=("object", "array"), default="array")
+    parser.add_argument("--ticks-between-data-points", type=int, default=4)
+    parser.add_argument("--alpha", type=float, default=.01, help="exits with an error if any p value is below this")
+    arguments = parser.parse_args()
+
+    settings = Headless.load_settings(arguments.settings)
+    ticks = arguments.ticks if arguments.ticks != None else arguments.days * sum(settings.day_phase_lengths)
+
+    results = {}
+    for index, mode in enumerate(("agent", "batch")):
+        mode_settings = copy.copy(settings)
+        mode_settings.transmission_mode = mode
+        print(f"running {arguments.replicates} replicates with transmission_mode {mode}", file=sys.stderr)
+        #different seeds for each mode so the samples are independent
+        results[mode] = Ensemble.run_ensemble(arguments.population, arguments.hospital_capacity, mode_settings, arguments.replicates, ticks, arguments.engine, arguments.ticks_between_data_points, arguments.base_seed + index * arguments.replicates, arguments.processes, progress=False)
+
+    rows = compare(results["agent"], results["batch"])
+    print(f"{'statistic':<20}{'agent':>12}{'batch':>12}{'ks':>8}{'p':>8}")
+    for name, mean_agent, mean_batch, distance, p_value in rows:
+        print(f"{name:<20}{mean_agent:>12.1f}{mean_batch:>12.1f}{distance:>8.3f}{p_value:>8.3f}")
+
+    agent_time = numpy.mean(results["agent"].wall_times)
+    batch_time = numpy.mean(results["batch"].wall_times)
+    print(f"mean wall time per replicate: agent {agent_time:.2f}s, batch {batch_time:.2f}s ({agent_time / batch_time:.2f}x)")
+
+    failed = [i[0] for i in rows if i[4] < arguments.alpha]
+    if len(failed) > 0:
+        print(f"distributions differ (p < {arguments.alpha}): {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
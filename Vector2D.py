@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 class Vector2D:
+    #no per instance dict, there is one of these for the position and target of every person
+    __slots__ = ("x", "y")
     x:float
     y:float
 
@@ -36,6 +38,12 @@ class Vector2D:
     def copy(self):
         return Vector2D(self.x, self.y)
     
+    #moves v1 a fraction t of the way to v2 without making new vectors
+    #only for vectors that nothing else holds on to, everyone holding v1 sees it move
+    def lerp_in_place(v1:Vector2D, v2:Vector2D, t:float) -> None:
+        v1.x += (v2.x - v1.x)*t
+        v1.y += (v2.y - v1.y)*t
+
     #for ease of use
     def __add__(self, other:Vector2D) -> Vector2D:
         return Vector2D.add(self, other)
@@ -51,6 +59,22 @@ class Vector2D:
 
     def __truediv__(self, other:int | float) -> Vector2D:
         return self * (1/other)
+
+    #in place operators (+=, -=, *=), same caveat as lerp_in_place()
+    def __iadd__(self, other:Vector2D) -> Vector2D:
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def __isub__(self, other:Vector2D) -> Vector2D:
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def __imul__(self, other:int | float) -> Vector2D:
+        self.x *= other
+        self.y *= other
+        return self
     
     #for debugging
     def __str__(self):
@@ -0,0 +1,258 @@
+#runs a world in a worker process, so a slow tick never drops frames and a slow frame never stalls the simulation
+#
+#the worker publishes what the ui needs (positions, infection and immunity state, occupancy and counters)
+#into one of two buffers in shared memory, each guarded by a lock:
+#the worker only writes the buffer that isnt the latest one, and skips publishing if the ui is still reading it
+#the ui reads the latest complete buffer in place (no copies), holding its lock until it moves on to a newer one
+#pause and speed commands go to the worker over a pipe, data points for the graph come back over the same pipe
+import multiprocessing
+import os
+import tempfile
+import time
+from multiprocessing import shared_memory
+import numpy
+import Simulation
+import ArraySimulation
+import Snapshot
+import Scheduler
+
+#ticks per second at 1x speed (same as the main loop, Scheduler.max_speed ticks as fast as possible)
+ticks_per_second: int = 50
+#the worker doesnt publish more often than the display rate
+publishes_per_second: int = 60
+#bytes at the start of the shared memory that hold the index of the latest buffer
+control_size: int = 64
+
+#(name, dtype, shape) of the arrays in each buffer
+#header is (tick, day, time, compartment counts...)
+def get_layout(population:int, building_count:int) -> list[tuple[str, type, tuple[int, ...]]]:
+    return [
+        ("header", numpy.int64, (3 + len(Simulation.Compartments),)),
+        ("position", numpy.float64, (population, 2)),
+        ("immunity", numpy.float64, (population,)),
+        ("infection_progress", numpy.int64, (population,)),
+        ("current_building", numpy.int64, (population,)),
+        ("occupancy", numpy.int64, (building_count,)),
+        ("alive", bool, (population,)),
+        ("infected", bool, (population,)),
+        ("being_treated", bool, (population,)),
+    ]
+
+#views of the arrays of both buffers in a block of shared memory (or None to only work out the size)
+#returns (buffers, size of the block in bytes)
+def get_buffers(memory:memoryview | None, population:int, building_count:int) -> tuple[list[dict[str, numpy.ndarray]], int]:
+    buffers = []
+    offset = control_size
+    for i in range(2):
+        arrays = {}
+        for name, dtype, shape in get_layout(population, building_count):
+            if memory != None:
+                arrays[name] = numpy.ndarray(shape, dtype=dtype, buffer=memory, offset=offset)
+            offset += -(-numpy.dtype(dtype).itemsize * int(numpy.prod(shape)) // 64) * 64
+        buffers.append(arrays)
+    return buffers, offset
+
+#copies the state of a world (either engine) into a buffer
+#building_ids maps id(building) to its index in get_all_buildings() and is only needed for Simulation.World
+def write_state(world:Simulation.World, arrays:dict[str, numpy.ndarray], building_ids:dict[int, int] | None) -> None:
+    arrays["header"][:] = (world.day * world.day_length + world.time, world.day, world.time) + world.compartments()
+
+    #without positions in the world the camera places people itself (the published positions stay 0)
+    track_positions = world.settings.track_positions
+
+    if isinstance(world, ArraySimulation.Array_World):
+        for name in ("immunity", "infection_progress", "current_building", "occupancy", "alive", "infected", "being_treated"):
+            arrays[name][:] = getattr(world, name)
+        if track_positions:
+            arrays["position"][:] = world.position
+        return
+
+    people = world.people
+    if track_positions:
+        arrays["position"][:] = numpy.array([i.position.tuple() for i in people], dtype=numpy.float64).reshape(len(people), 2)
+    arrays["immunity"][:] = numpy.fromiter((i.immunity for i in people), dtype=numpy.float64, count=len(people))
+    arrays["infection_progress"][:] = numpy.fromiter((i.infection_progress for i in people), dtype=numpy.int64, count=len(people))
+    arrays["current_building"][:] = numpy.fromiter((building_ids[id(i.current_building)] for i in people), dtype=numpy.int64, count=len(people))
+    arrays["occupancy"][:] = numpy.fromiter((len(i.people) for i in world.get_all_buildings()), dtype=numpy.int64, count=len(building_ids))
+    arrays["alive"][:] = numpy.fromiter((i.alive for i in people), dtype=bool, count=len(people))
+    arrays["infected"][:] = numpy.fromiter((i.infected for i in people), dtype=bool, count=len(people))
+    arrays["being_treated"][:] = numpy.fromiter((i.being_treated for i in people), dtype=bool, count=len(people))
+
+#writes the state of the world into the buffer that isnt the latest one and makes it the latest
+#returns False (without waiting) if the ui is still reading that buffer
+def publish(world:Simulation.World, buffers:list[dict[str, numpy.ndarray]], latest:numpy.ndarray, locks:tuple, building_ids:dict[int, int] | None) -> bool:
+    back = 1 - int(latest[0])
+    if not locks[back].acquire(False):
+        return False
+    try:
+        write_state(world, buffers[back], building_ids)
+    finally:
+        locks[back].release()
+    latest[0] = back
+    return True
+
+#entry point of the worker process
+def run_worker(snapshot_path:str, memory_name:str, locks:tuple, connection, ticks_between_data_points:int) -> None:
+    world = Snapshot.load_world(snapshot_path)
+    buildings = world.get_all_buildings()
+    building_ids = None if isinstance(world, ArraySimulation.Array_World) else {id(building): index for index, building in enumerate(buildings)}
+
+    memory = shared_memory.SharedMemory(memory_name)
+    buffers, size = get_buffers(memory.buf, len(world.people), len(buildings))
+    latest = numpy.ndarray((1,), dtype=numpy.int64, buffer=memory.buf)
+    publish(world, buffers, latest, locks, building_ids)
+    connection.send(("ready",))
+
+    def tick() -> None:
+        world.tick()
+        if world.time % ticks_between_data_points == 0:
+            connection.send(("data", world.day * world.day_length + world.time, world.compartments()))
+
+    scheduler = Scheduler.Scheduler(ticks_per_second)
+    speed = 1.
+    last_publish_time = time.perf_counter()
+    while True:
+        #handle commands, just waiting for the next one while paused
+        timeout = None if world.paused else max(scheduler.get_next_tick_time(speed) - time.perf_counter(), 0)
+        if connection.poll(timeout):
+            command, value = connection.recv()
+            if command == "stop":
+                break
+            elif command == "pause":
+                world.paused = value
+                #nothing is owed for the time spent paused
+                scheduler.run(tick, speed, True, 0)
+            elif command == "speed":
+                speed = value
+            continue
+
+        #tick until the next publish is due at the latest
+        scheduler.run(tick, speed, world.paused, time.perf_counter() + 1 / publishes_per_second)
+
+        now = time.perf_counter()
+        if now - last_publish_time > 1 / publishes_per_second and publish(world, buffers, latest, locks, building_ids):
+            last_publish_time = now
+
+    #views into the shared memory have to be gone before it can be closed
+    del buffers, latest
+    memory.close()
+
+#stand-in for a world that is running in a worker process, built from the world before it starts running
+#reads the latest state published by the worker, with the same arrays as ArraySimulation.Array_World so the camera and grapher work unchanged
+#call update() once per frame, tick() does nothing since the worker ticks on its own
+class Remote_World(ArraySimulation.Array_World):
+    snapshot_path: str
+    memory: shared_memory.SharedMemory
+    buffers: list[dict[str, numpy.ndarray]]
+    #index of the latest buffer, written by the worker
+    latest: numpy.ndarray
+    locks: tuple
+    connection: object
+    process: multiprocessing.Process
+
+    #buffer the ui is reading (and holds the lock of)
+    current: int | None = None
+    #(tick, day, time, compartment counts...) of the current buffer
+    header: numpy.ndarray
+    requested_paused: bool
+    speed: float = 1.
+
+    def __init__(self, world:Simulation.World, ticks_between_data_points:int = 4) -> None:
+        #buildings never change so they stay here, people only live in the worker from now on
+        self.settings = world.settings
+        self.day_length = world.day_length
+        self.buildings = world.buildings
+        self.building_grid = world.building_grid
+        self.index_buildings()
+        for building in self.building_list:
+            building.people = Simulation.Occupants()
+        self.people = ArraySimulation.People_Views(self)
+        self.requested_paused = world.paused
+
+        #the world is handed to the worker as a snapshot
+        file, self.snapshot_path = tempfile.mkstemp(suffix=".snapshot")
+        os.close(file)
+        Snapshot.save_world(world, self.snapshot_path)
+
+        buffers, size = get_buffers(None, len(world.people), len(self.building_list))
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.buffers, size = get_buffers(self.memory.buf, len(world.people), len(self.building_list))
+        self.latest = numpy.ndarray((1,), dtype=numpy.int64, buffer=self.memory.buf)
+        self.latest[0] = 0
+
+        #spawned instead of forked so the worker doesnt inherit the window and graph of this process
+        context = multiprocessing.get_context("spawn")
+        self.locks = (context.Lock(), context.Lock())
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(self.snapshot_path, self.memory.name, self.locks, worker_connection, ticks_between_data_points), daemon=True)
+        self.process.start()
+
+        #wait for the first published state
+        self.connection.recv()
+        self.update()
+
+    @property
+    def paused(self) -> bool:
+        return self.requested_paused
+
+    @paused.setter
+    def paused(self, paused:bool) -> None:
+        self.requested_paused = paused
+        self.connection.send(("pause", paused))
+
+    @property
+    def time(self) -> int:
+        return int(self.header[2])
+
+    @property
+    def day(self) -> int:
+        return int(self.header[1])
+
+    @property
+    def compartment_counts(self) -> list[int]:
+        return self.header[3:].tolist()
+
+    #changes the speed of the simulation (1 is ticks_per_second ticks per second)
+    def set_speed(self, speed:float) -> None:
+        if speed != self.speed:
+            self.speed = speed
+            self.connection.send(("speed", speed))
+
+    #switches to the latest state published by the worker and returns the data points (tick, compartments) it sent since the last update
+    def update(self) -> list[tuple[int, tuple[int, ...]]]:
+        latest = int(self.latest[0])
+        if latest != self.current:
+            self.locks[latest].acquire()
+            if self.current != None:
+                self.locks[self.current].release()
+            self.current = latest
+            for name, array in self.buffers[latest].items():
+                setattr(self, name, array)
+
+        data_points = []
+        while self.connection.poll():
+            message = self.connection.recv()
+            if message[0] == "data":
+                data_points.append((message[1], message[2]))
+        return data_points
+
+    def tick(self) -> None:
+        pass
+
+    #stops the worker and frees the shared memory
+    def close(self) -> None:
+        if self.process.is_alive():
+            self.connection.send(("stop", None))
+            self.process.join(5)
+        if self.current != None:
+            self.locks[self.current].release()
+            self.current = None
+
+        #views into the shared memory have to be gone before it can be closed
+        for name in self.buffers[0]:
+            self.__dict__.pop(name, None)
+        self.buffers = []
+        self.latest = None
+        self.memory.close()
+        self.memory.unlink()
+        os.remove(self.snapshot_path)